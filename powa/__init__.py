@@ -20,7 +20,9 @@ from tornado.options import options
 from tornado.web import Application
 from tornado.web import URLSpec as U
 
-from powa import ui_methods, ui_modules
+from powa import ui_methods, ui_modules, webstats
+from powa.breaker import CircuitBreaker
+from powa.cache import TTLCache
 from powa.collector import (
     CollectorDbCatRefreshHandler,
     CollectorForceSnapshotHandler,
@@ -30,7 +32,9 @@ from powa.config import (
     RemoteConfigOverview,
     RepositoryConfigOverview,
 )
+from powa.dashboards import DatasourceBatchHandler
 from powa.database import DatabaseOverview, DatabaseSelector
+from powa.executor import DatasourceExecutor
 from powa.framework import AuthHandler
 from powa.function import FunctionOverview
 from powa.io import (
@@ -39,9 +43,11 @@ from powa.io import (
     ByObjIoOverview,
 )
 from powa.overview import Overview
+from powa.pool import ConnectionPool
 from powa.qual import QualOverview
 from powa.query import QueryOverview
 from powa.server import ServerOverview, ServerSelector
+from powa.session import SessionCache, SessionStore
 from powa.slru import ByNameSlruOverview
 from powa.user import LoginHandler, LogoutHandler
 from powa.wizard import IndexSuggestionHandler
@@ -56,6 +62,16 @@ class IndexHandler(AuthHandler):
         return self.redirect(options.index_url)
 
 
+class WebStatsHandler(AuthHandler):
+    """
+    Handler exposing the powa-web internal statistics, only registered if the
+    webstats option is enabled.
+    """
+
+    def get(self):
+        self.render_json(webstats.snapshot())
+
+
 def make_app(**kwargs):
     """
     Parse the config file and instantiate a tornado app.
@@ -96,8 +112,23 @@ def make_app(**kwargs):
             IndexSuggestionHandler,
             name="index_suggestion",
         ),
+        U(
+            r"%sdatasource/batch/" % options.url_prefix,
+            DatasourceBatchHandler,
+            name="datasource_batch",
+        ),
     ]
 
+    # The internal statistics are only exposed if asked to
+    if options.webstats:
+        URLS.append(
+            U(
+                r"%swebstats/" % options.url_prefix,
+                WebStatsHandler,
+                name="webstats",
+            )
+        )
+
     for dashboard in (
         Overview,
         ServerOverview,
@@ -114,6 +145,73 @@ def make_app(**kwargs):
     ):
         URLS.extend(dashboard.url_specs(options.url_prefix))
 
+    if options.connection_pool:
+        kwargs.setdefault(
+            "connection_pool",
+            ConnectionPool(
+                min_size=options.pool_min_size,
+                max_size=options.pool_max_size,
+                idle_timeout=options.pool_idle_timeout,
+                check_interval=options.pool_check_interval,
+                timeout=options.pool_timeout,
+            ),
+        )
+
+    capabilities_cache = TTLCache(options.capability_cache_ttl)
+    webstats.register("capabilities_cache", capabilities_cache.stats)
+    kwargs.setdefault("capabilities_cache", capabilities_cache)
+
+    servers_cache = TTLCache(options.servers_cache_ttl)
+    webstats.register("servers_cache", servers_cache.stats)
+    kwargs.setdefault("servers_cache", servers_cache)
+
+    if options.dashboard_cache_ttl > 0:
+        dashboard_cache = TTLCache(options.dashboard_cache_ttl, max_size=1000)
+        webstats.register("dashboard_cache", dashboard_cache.stats)
+        kwargs.setdefault("dashboard_cache", dashboard_cache)
+
+    if options.result_cache_size > 0:
+        result_cache = TTLCache(
+            options.result_cache_ttl,
+            max_size=options.result_cache_size,
+            max_bytes=(options.result_cache_max_memory * 1024 * 1024) or None,
+        )
+        webstats.register("result_cache", result_cache.stats)
+        kwargs.setdefault("result_cache", result_cache)
+
+    if options.auth_cache_ttl > 0:
+        auth_cache = TTLCache(options.auth_cache_ttl, max_size=1000)
+        webstats.register("auth_cache", auth_cache.stats)
+        kwargs.setdefault("auth_cache", auth_cache)
+
+    if options.session_cache_ttl > 0:
+        session_cache = SessionCache(options.session_cache_ttl, max_size=10000)
+        webstats.register("session_cache", session_cache.stats)
+        kwargs.setdefault("session_cache", session_cache)
+
+    if options.server_side_sessions:
+        kwargs.setdefault(
+            "session_store",
+            SessionStore(
+                max(options.cookie_expires_days, 1) * 86400, max_size=10000
+            ),
+        )
+
+    kwargs.setdefault(
+        "circuit_breaker",
+        CircuitBreaker(
+            min_delay=options.remote_retry_min_delay,
+            max_delay=options.remote_retry_max_delay,
+        ),
+    )
+
+    if options.executor_workers > 0:
+        executor = DatasourceExecutor(
+            options.executor_workers, options.executor_max_per_server
+        )
+        webstats.register("executor", executor.stats)
+        kwargs.setdefault("datasource_executor", executor)
+
     _cls = Application
     if "legacy_wsgi" in kwargs:
         from tornado.wsgi import WSGIApplication
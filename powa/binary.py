@@ -0,0 +1,179 @@
+"""
+Binary encoding of the metric groups data.
+
+The data is encoded using MessagePack (https://msgpack.org/), implemented
+here as only a small subset is needed.  The columns of the columnar format
+are encoded as typed buffers rather than lists of values, so that the
+browser can use them as typed arrays without parsing anything:
+
+    {
+        "columns": [...],
+        "ts": <bin: little-endian int64 epoch in milliseconds>,
+        "types": {column: "i8" | "f8" | "list"},
+        "values": {column: <bin: little-endian int64 or float64> | [...]},
+        ...
+    }
+
+Missing float64 values are encoded as NaN.  Columns that can't be stored
+as numbers, like text columns, are kept as plain lists.
+"""
+
+import struct
+import sys
+from array import array
+from datetime import datetime
+from decimal import Decimal
+
+MEDIA_TYPE = "application/vnd.powa.columnar+msgpack"
+
+NAN = float("nan")
+
+
+def _typed_buffer(values):
+    """
+    Return a (type, array) tuple for the given list of values, or None if
+    they can't all be stored as numbers.
+    """
+    try:
+        return "i8", array("q", values)
+    except (TypeError, OverflowError):
+        pass
+
+    try:
+        return "f8", array("d", values)
+    except TypeError:
+        pass
+
+    try:
+        return "f8", array("d", (NAN if v is None else v for v in values))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bytes(buf):
+    if sys.byteorder != "little":
+        buf = array(buf.typecode, buf)
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def pack_columnar(data):
+    """
+    Encode the given columnar data, as returned by to_columnar(), to
+    MessagePack, storing the ts and the numeric columns as typed buffers.
+    """
+    data = dict(data)
+    types = {}
+    values = {}
+    for col, vals in data.pop("values", {}).items():
+        typed = _typed_buffer(vals)
+        if typed is None:
+            types[col] = "list"
+            values[col] = vals
+        else:
+            types[col] = typed[0]
+            values[col] = _to_bytes(typed[1])
+
+    ts = data.pop("ts", [])
+    try:
+        ts = array("q", [int(t * 1000) for t in ts])
+    except TypeError:
+        # ts isn't a number, leave it as-is
+        data["ts"] = ts
+    else:
+        data["ts"] = _to_bytes(ts)
+
+    data["types"] = types
+    data["values"] = values
+    return packb(data)
+
+
+def packb(obj):
+    """
+    Encode the given object to MessagePack.
+    """
+    out = []
+    _pack(obj, out)
+    return b"".join(out)
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(b"\xc0")
+    elif obj is True:
+        out.append(b"\xc3")
+    elif obj is False:
+        out.append(b"\xc2")
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, float):
+        out.append(struct.pack(">Bd", 0xCB, obj))
+    elif isinstance(obj, Decimal):
+        out.append(struct.pack(">Bd", 0xCB, float(obj)))
+    elif isinstance(obj, str):
+        _pack_str(obj, out)
+    elif isinstance(obj, datetime):
+        _pack_str(obj.strftime("%Y-%m-%d %H:%M:%S%z"), out)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        obj = bytes(obj)
+        n = len(obj)
+        if n < 0x100:
+            out.append(struct.pack(">BB", 0xC4, n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xC5, n))
+        else:
+            out.append(struct.pack(">BI", 0xC6, n))
+        out.append(obj)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(struct.pack(">B", 0x80 | n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xDE, n))
+        else:
+            out.append(struct.pack(">BI", 0xDF, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(struct.pack(">B", 0x90 | n))
+        elif n < 0x10000:
+            out.append(struct.pack(">BH", 0xDC, n))
+        else:
+            out.append(struct.pack(">BI", 0xDD, n))
+        for value in obj:
+            _pack(value, out)
+    elif hasattr(obj, "to_json"):
+        _pack(obj.to_json(), out)
+    else:
+        raise TypeError("Can't encode %r to MessagePack" % obj)
+
+
+def _pack_int(obj, out):
+    if 0 <= obj < 0x80:
+        out.append(struct.pack(">B", obj))
+    elif -0x20 <= obj < 0:
+        out.append(struct.pack(">b", obj))
+    elif 0 <= obj < 0x10000000000000000:
+        out.append(struct.pack(">BQ", 0xCF, obj))
+    elif -0x8000000000000000 <= obj < 0:
+        out.append(struct.pack(">Bq", 0xD3, obj))
+    else:
+        # too big for MessagePack, fall back to a float
+        out.append(struct.pack(">Bd", 0xCB, float(obj)))
+
+
+def _pack_str(obj, out):
+    obj = obj.encode("utf8")
+    n = len(obj)
+    if n < 32:
+        out.append(struct.pack(">B", 0xA0 | n))
+    elif n < 0x100:
+        out.append(struct.pack(">BB", 0xD9, n))
+    elif n < 0x10000:
+        out.append(struct.pack(">BH", 0xDA, n))
+    else:
+        out.append(struct.pack(">BI", 0xDB, n))
+    out.append(obj)
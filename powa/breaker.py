@@ -0,0 +1,149 @@
+"""
+Circuit breaker for the remote servers.
+"""
+
+import logging
+import threading
+import time
+
+
+class ServerUnavailable(Exception):
+    """
+    Raised when trying to connect to a server known to be unreachable.
+    """
+
+    pass
+
+
+# Errors raised by the server itself while establishing the connection,
+# which libpq reports without an SQLSTATE.  They're specific to the role,
+# the database or the SSL configuration, and don't mean that the server is
+# unreachable.  "SSL SYSCALL error" is an I/O error during the handshake and
+# isn't matched by "SSL error".
+_SERVER_ERRORS = (
+    "authentication failed",
+    "fe_sendauth",
+    "is not permitted to log in",
+    "no pg_hba.conf entry",
+    "does not exist",
+    "permission denied",
+    "too many connections",
+    "remaining connection slots are reserved",
+    "SSL error",
+    "does not support SSL",
+)
+
+
+def is_connection_failure(error):
+    """
+    Return whether the given error raised while connecting means that the
+    server couldn't be reached: connection refused, timeout, host
+    unreachable...  Errors with an SQLSTATE only count if they belong to the
+    connection exception class (08).  Authentication failures or a missing
+    role or database don't count, so that they don't make the server
+    unavailable for everyone else.
+    """
+    pgcode = getattr(error, "pgcode", None)
+    if pgcode is not None:
+        return pgcode.startswith("08")
+
+    message = str(error)
+    return not any(err in message for err in _SERVER_ERRORS)
+
+
+class CircuitBreaker(object):
+    """
+    Keep track of the servers that powa-web couldn't connect to, so that
+    callers fail fast rather than waiting for a connection timeout on every
+    attempt.
+
+    After a failed connection attempt, a server is considered down for
+    min_delay seconds.  The first attempt after that delay is let through,
+    and each new failure doubles the delay, up to max_delay seconds.  A
+    successful connection forgets about the server.
+
+    Servers are identified by their (host, port), and the state is shared by
+    all the requests and threads.  Only the failures to reach a server should
+    be recorded, see is_connection_failure().
+    """
+
+    def __init__(self, min_delay=10, max_delay=300, logger=None):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.logger = logger or logging.getLogger("tornado.application")
+        self._lock = threading.Lock()
+        # (host, port) -> (number of failures, down until, last error)
+        self._down = {}
+
+    def _key(self, host, port):
+        return (str(host), str(port))
+
+    def check(self, host, port):
+        """
+        Raise ServerUnavailable if the given server is known to be down.
+        """
+        with self._lock:
+            state = self._down.get(self._key(host, port))
+
+        if state is None:
+            return
+
+        failures, down_until, error = state
+        remaining = down_until - time.time()
+        if remaining > 0:
+            raise ServerUnavailable(
+                "Server %s:%s is unreachable, next connection attempt in "
+                "%d seconds.  Last error: %s"
+                % (host, port, remaining + 1, error)
+            )
+
+    def success(self, host, port):
+        """
+        Record a successful connection to the given server.
+        """
+        with self._lock:
+            state = self._down.pop(self._key(host, port), None)
+
+        if state is not None:
+            self.logger.info("Server %s:%s is reachable again", host, port)
+
+    def failure(self, host, port, error):
+        """
+        Record a failed connection to the given server.
+        """
+        key = self._key(host, port)
+        with self._lock:
+            failures = self._down.get(key, (0, None, None))[0] + 1
+            delay = min(self.min_delay * 2 ** (failures - 1), self.max_delay)
+            error = str(error).strip()
+            self._down[key] = (failures, time.time() + delay, error)
+
+        self.logger.warning(
+            "Could not connect to server %s:%s, %d failure(s), next attempt "
+            "in %d seconds: %s",
+            host,
+            port,
+            failures,
+            delay,
+            error,
+        )
+
+    def describe(self, host, port):
+        """
+        Return a description of the given server state.
+        """
+        with self._lock:
+            state = self._down.get(self._key(host, port))
+
+        if state is None:
+            return "ok"
+
+        failures, down_until, error = state
+        remaining = down_until - time.time()
+        if remaining > 0:
+            return "down (%d failure(s), retry in %ds): %s" % (
+                failures,
+                remaining + 1,
+                error,
+            )
+        return "down (%d failure(s), retry allowed): %s" % (failures, error)
@@ -0,0 +1,129 @@
+"""
+Process-wide caches.
+"""
+
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+    A thread-safe dict whose entries expire after ttl seconds.
+
+    If max_size is set, the least recently used entries are evicted when the
+    cache is full.  Likewise, if max_bytes is set, entries are evicted so that
+    the total of the sizes given to set() stays below it.  Values bigger than
+    a tenth of max_bytes aren't cached at all, so that a single one can't
+    evict most of the others.
+    """
+
+    def __init__(self, ttl, max_size=None, max_bytes=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # key -> (expiration time, value, size)
+        self._data = {}
+        self._bytes = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for the given key, or default if there's
+        none or if it expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self._pop_locked(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            if self.max_size is not None or self.max_bytes is not None:
+                # keep the most recently used entries last
+                self._data[key] = self._data.pop(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None, size=0):
+        """
+        Cache the given value, for ttl seconds if provided, or for the cache
+        default ttl.  size is the approximate size of the value in bytes, only
+        used if max_bytes is set.  Returns whether the value was cached.
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            self._pop_locked(key)
+            if self.max_bytes is not None and size > self.max_bytes // 10:
+                self.rejected += 1
+                return False
+
+            if self._is_full_locked(size):
+                self._evict_locked(size)
+            self._data[key] = (time.time() + ttl, value, size)
+            self._bytes += size
+            return True
+
+    def delete(self, key):
+        """
+        Remove the given key, if present.
+        """
+        with self._lock:
+            self._pop_locked(key)
+
+    def invalidate(self, predicate=None):
+        """
+        Remove the entries whose key matches the given predicate, or all the
+        entries if no predicate is given.
+        """
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                self._bytes = 0
+                return
+
+            for key in [k for k in self._data if predicate(k)]:
+                self._pop_locked(key)
+
+    def _pop_locked(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _is_full_locked(self, size=0):
+        if self.max_size is not None and len(self._data) >= self.max_size:
+            return True
+        if self.max_bytes is not None and self._bytes + size > self.max_bytes:
+            return True
+        return False
+
+    def _evict_locked(self, size=0):
+        now = time.time()
+        for key in [k for k, v in self._data.items() if v[0] <= now]:
+            self._pop_locked(key)
+
+        # dicts are ordered, so the first entries are the least recently used
+        while self._data and self._is_full_locked(size):
+            self._pop_locked(next(iter(self._data)))
+
+    def stats(self):
+        """
+        Return the cache statistics.
+        """
+        with self._lock:
+            stats = {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+            if self.max_bytes is not None:
+                stats["bytes"] = self._bytes
+                stats["rejected"] = self.rejected
+            return stats
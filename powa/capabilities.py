@@ -0,0 +1,125 @@
+"""
+Description of what a given server provides.
+"""
+
+import hashlib
+import re
+
+
+def parse_version(version):
+    """
+    Return a tuple with all digits of the given version string, ignoring any
+    extraneous characters, or None if it can't be parsed.
+    """
+    if version is None:
+        return None
+
+    version = re.search(r"[0-9\.]*[0-9]", version)
+    if version is None:
+        return None
+
+    return tuple(map(int, version.group(0).split(".")))
+
+
+def parse_version_num(version):
+    """
+    Return the server_version_num corresponding to the given server_version
+    string, or None if it can't be parsed.
+    """
+    version = parse_version(version)
+    if version is None:
+        return None
+
+    version = version + (0, 0)
+    if version[0] >= 10:
+        return version[0] * 10000 + version[1]
+    return version[0] * 10000 + version[1] * 100 + version[2]
+
+
+class ServerCapabilities(object):
+    """
+    Capabilities of a server, used to know which metrics and widgets are
+    available.
+
+    Attributes:
+        srvid (str):
+            the server identifier
+        pg_version_num (int):
+            the PostgreSQL server_version_num
+        block_size (int):
+            the server block size
+        extensions (dict):
+            a dict of extension name -> tuple with all digits of its version
+            (or None if unknown), for the extensions installed on the server
+            default database
+        modules (frozenset):
+            the powa modules having at least an enabled snapshot function
+        allow_ui_connection (bool):
+            whether the UI is allowed to connect to the server
+
+    Any of those can be None if the information couldn't be retrieved.
+    """
+
+    def __init__(
+        self,
+        srvid,
+        pg_version_num=None,
+        block_size=None,
+        extensions=None,
+        modules=None,
+        allow_ui_connection=None,
+    ):
+        self.srvid = str(srvid)
+        self.pg_version_num = pg_version_num
+        self.block_size = block_size
+        self.extensions = extensions
+        self.modules = modules
+        self.allow_ui_connection = allow_ui_connection
+
+    def extension_version(self, extname):
+        """
+        Returns a tuple with all digits of the version of the given extension,
+        or None if it's not installed or unknown.
+        """
+        if self.extensions is None:
+            return None
+
+        return self.extensions.get(extname)
+
+    def has_extension_version(self, extname, version):
+        """
+        Returns whether the given extension is installed in at least the given
+        version.
+        """
+        remver = self.extension_version(extname)
+        if remver is None:
+            return False
+
+        return remver >= tuple(map(int, version.split(".")))
+
+    def has_module(self, name):
+        """
+        Returns whether the given module has at least an enabled snapshot
+        function.
+        """
+        if self.modules is None:
+            return False
+
+        return name in self.modules
+
+    @property
+    def fingerprint(self):
+        """
+        A string that changes whenever any of the capabilities changes.
+        """
+        desc = repr(
+            (
+                self.srvid,
+                self.pg_version_num,
+                self.block_size,
+                sorted((self.extensions or {}).items()),
+                sorted(self.modules or ()),
+                self.allow_ui_connection,
+            )
+        )
+        return hashlib.sha1(desc.encode("utf8")).hexdigest()
@@ -19,13 +19,15 @@ class CollectorServerDetail(MetricGroupDef):
     def query(self):
         return None
 
-    def post_process(self, data, server, **kwargs):
+    async def post_process(self, data, server, **kwargs):
         sql = """SELECT *
             FROM {powa}.powa_servers s
             JOIN {powa}.powa_snapshot_metas m ON m.srvid = s.id
             WHERE s.id = %(server)s"""
 
-        row = self.execute(sql, params={"server": server})
+        row = await self.aexecute(
+            sql, params={"server": server}, readonly=True
+        )
 
         # unexisting server, bail out
         if len(row) != 1:
@@ -34,22 +36,22 @@ class CollectorServerDetail(MetricGroupDef):
 
         status = "unknown"
         if server == "0":
-            status = self.execute("""SELECT
+            rows = await self.aexecute(
+                """SELECT
                     CASE WHEN count(*) = 1 THEN 'running'
                     ELSE 'stopped'
                     END AS status
                     FROM pg_stat_activity
-                    WHERE application_name LIKE 'PoWA - %%'""")[0]["status"]
+                    WHERE application_name LIKE 'PoWA - %%'""",
+                readonly=True,
+            )
+            status = rows[0]["status"]
         else:
-            raw = self.notify_collector("WORKERS_STATUS", [server], 2)
+            stats = await self.get_collector_status()
 
             status = None
-            # did we receive a valid answer?
-            if len(raw) != 0 and "OK" in raw[0]:
-                # just keep the first one
-                tmp = raw[0]["OK"]
-                if server in tmp:
-                    status = json.loads(tmp)[server]
+            if stats is not None:
+                status = stats.get(server)
 
         if status is None:
             return {
@@ -70,10 +72,10 @@ class CollectorServerDetail(MetricGroupDef):
 class CollectorReloadHandler(AuthHandler):
     """Page allowing to choose a server."""
 
-    def get(self):
+    async def get(self):
         res = False
 
-        answers = self.notify_collector("RELOAD")
+        answers = await self.notify_collector("RELOAD")
 
         # iterate over the results.  If at least one OK is received, report
         # success, otherwise failure
@@ -82,14 +84,19 @@ class CollectorReloadHandler(AuthHandler):
                 res = True
                 break
 
+        # the servers configuration may have changed
+        if res:
+            self.invalidate_servers()
+            self.invalidate_capabilities()
+
         self.render_json(res)
 
 
 class CollectorForceSnapshotHandler(AuthHandler):
     """Request an immediate snapshot on the given server."""
 
-    def get(self, server):
-        answers = self.notify_collector("FORCE_SNAPSHOT", [server])
+    async def get(self, server):
+        answers = await self.notify_collector("FORCE_SNAPSHOT", [server])
 
         self.render_json(answers)
 
@@ -97,13 +104,16 @@ class CollectorForceSnapshotHandler(AuthHandler):
 class CollectorDbCatRefreshHandler(AuthHandler):
     """Refresh the catalogs for the given cadatabase(s) on the given server."""
 
-    def post(self):
+    async def post(self):
         payload = json.loads(self.request.body.decode("utf8"))
         nb_db = len(payload["dbnames"])
         args = [payload["srvid"], str(nb_db)]
         if nb_db > 0:
             args.extend(payload["dbnames"])
 
-        answers = self.notify_collector("REFRESH_DB_CAT", args)
+        answers = await self.notify_collector("REFRESH_DB_CAT", args)
+
+        # the extensions may have changed
+        self.invalidate_capabilities(payload["srvid"])
 
         self.render_json(answers)
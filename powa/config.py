@@ -4,7 +4,6 @@ Dashboard for the configuration summary page.
 
 from __future__ import absolute_import
 
-import json
 from powa.collector import CollectorServerDetail
 from powa.dashboards import (
     ContentWidget,
@@ -84,7 +83,7 @@ class ServersErrors(ContentWidget):
     title = "Errors"
     data_url = r"/config/errors"
 
-    def get(self):
+    async def get(self):
         sql = """SELECT srvid,
             CASE WHEN id = 0 THEN
                '<local>'
@@ -98,7 +97,7 @@ class ServersErrors(ContentWidget):
             ORDER BY 1
         """
 
-        rows = self.execute(sql)
+        rows = await self.aexecute(sql)
 
         self.render_json(rows)
 
@@ -112,7 +111,7 @@ class AllCollectorsDetail(ContentWidget):
     title = "Collector Detail"
     data_url = r"/config/allcollectors"
 
-    def get(self):
+    async def get(self):
         sql = """SELECT id,
             CASE WHEN id = 'collector'
                 THEN 'Remote collector'
@@ -143,7 +142,7 @@ class AllCollectorsDetail(ContentWidget):
                 AND a.backend_type = n.backend_type
             ORDER BY 1"""
 
-        rows = self.execute(sql)
+        rows = await self.aexecute(sql)
 
         self.logger.warn("%r", rows[0])
         if rows[0]["not_authorized"] is True:
@@ -176,6 +175,7 @@ class PowaServersMetricGroup(MetricGroupDef):
     snapts = MetricDef(label="Last snapshot", type="string")
     no_err = MetricDef(label="Error", type="bool")
     collector_status = MetricDef(label="Collector Status", type="string")
+    ui_connection = MetricDef(label="UI connection", type="string")
 
     query = """SELECT id,
      CASE WHEN s.id = 0 THEN
@@ -217,28 +217,23 @@ class PowaServersMetricGroup(MetricGroupDef):
 
     def process(self, val, **kwargs):
         val["url"] = self.reverse_url("RemoteConfigOverview", val["id"])
+
+        # Report the remote servers known to be unreachable
+        breaker = self.application.settings.get("circuit_breaker")
+        if breaker is not None and val["id"] != 0:
+            val["ui_connection"] = breaker.describe(
+                val["hostname"], val["port"]
+            )
         return val
 
-    def post_process(self, data, **kwargs):
+    async def post_process(self, data, **kwargs):
         if len(data["data"]):
-            raw = self.notify_collector("WORKERS_STATUS", timeout=1)
-            if not raw:
-                return data
-
-            line = None
-            # get the first correct response only, if multiple answers were
-            # returned
-            while line is None and len(raw) > 0:
-                tmp = raw.pop(0)
-                if "OK" in tmp:
-                    line = tmp["OK"]
+            stats = await self.get_collector_status()
 
             # nothing correct, give up
-            if line is None or line == {}:
+            if not stats:
                 return data
 
-            stats = json.loads(line)
-
             for row in data["data"]:
                 srvid = str(row["id"])
                 if srvid in stats:
@@ -309,12 +304,14 @@ class PgSettingsMetricGroup(MetricGroupDef):
                 # ignore any error, we'll just fallback on remote check
                 pass
 
+        errmsg = None
         if values is None:
             try:
                 values = self.execute(self.__query, srvid=server)
-            except Exception:
-                # ignore any connection or remote execution error
-                pass
+            except Exception as e:
+                # ignore any connection or remote execution error, but keep
+                # the error message
+                errmsg = str(e)
 
         if values is not None:
             data = {"data": [self.process(val) for val in values]}
@@ -325,7 +322,7 @@ class PgSettingsMetricGroup(MetricGroupDef):
                     "alert": [
                         "Could not retrieve PostgreSQL"
                         + " settings "
-                        + "on remote server"
+                        + "on remote server: %s" % errmsg
                     ]
                 },
             }
@@ -4,12 +4,20 @@ Dashboard definition classes.
 This module provides several classes to define a Dashboard.
 """
 
+import asyncio
+import hashlib
+import json
+import math
+from datetime import datetime, timezone
 from operator import attrgetter
+from powa import binary, downsample, webstats
 from powa.compat import classproperty, with_metaclass
 from powa.framework import AuthHandler
-from powa.json import JSONizable
+from powa.json import JSONizable, to_json
 from powa.ui_modules import MenuEntry
-from tornado.web import URLSpec
+from tornado.locks import Semaphore
+from tornado.options import options
+from tornado.web import HTTPError, URLSpec
 
 try:
     from collections import OrderedDict
@@ -17,10 +25,106 @@ except ModuleNotFoundError:
     from ordereddict import OrderedDict
 
 import psycopg2
-from inspect import isfunction
+from inspect import isawaitable, isfunction
+from psycopg2.extensions import QueryCanceledError
 
 GLOBAL_COUNTER = 0
 
+# Maximum number of tiles fetched for a single request, see
+# MetricGroupHandler._get_tiles()
+MAX_TILES = 16
+
+# Number of rows encoded to estimate the size of a query result, see
+# MetricGroupHandler._get_result_size()
+RESULT_SIZE_SAMPLE = 20
+
+# Number of samples asking the queries for all the snapshots of the range
+FULL_RESOLUTION = 1 << 30
+
+# Media type used to ask for the columnar format of the metric groups
+COLUMNAR_MEDIA_TYPE = "application/vnd.powa.columnar+json"
+
+# Attributes of the metric groups only used on the server side, and not sent
+# to the frontend, see MetricGroupDef.to_json()
+SERVER_ONLY_ATTRIBUTES = (
+    "query",
+    "readonly",
+    "query_timeout",
+    "streaming",
+    "result_cache",
+    "incremental",
+    "tiled",
+    "downsample",
+    "sampling",
+)
+
+
+def parse_timestamp(value):
+    """
+    Return the epoch of the given from / to parameter, as sent by the UI, or
+    None if it can't be parsed.
+    """
+    if value is None:
+        return None
+
+    for fmt in ("%Y-%m-%d %H:%M:%S%z", "%Y-%m-%dT%H:%M:%S%z"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except (TypeError, ValueError):
+            pass
+
+    return None
+
+
+def format_timestamp(epoch):
+    """
+    Return the given epoch as a timestamp usable for the from / to
+    parameters.
+    """
+    value = datetime.fromtimestamp(epoch, timezone.utc)
+    if value.microsecond:
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+    return value.strftime("%Y-%m-%d %H:%M:%S%z")
+
+
+def rows_to_columnar(columns, rows):
+    """
+    Return the columnar representation of the given tuple rows, as returned
+    by execute(..., tuples=True): the list of columns besides ts, the list of
+    ts and a dict of column -> list of values.
+    """
+    columns = columns or []
+    values = {col: [] for col in columns}
+    if rows:
+        values = {col: list(vals) for col, vals in zip(columns, zip(*rows))}
+
+    return {
+        "columns": [col for col in columns if col != "ts"],
+        "ts": values.pop("ts", []),
+        "values": values,
+    }
+
+
+def to_columnar(data):
+    """
+    Convert the "data" list of dicts of a metric group result to the columnar
+    representation, keeping the other keys, like the messages, untouched.
+    """
+    if "data" not in data:
+        return data
+
+    rows = data.pop("data")
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    values = {col: [row.get(col) for row in rows] for col in columns}
+    data.update(
+        {
+            "columns": [col for col in columns if col != "ts"],
+            "ts": values.pop("ts", []),
+            "values": values,
+        }
+    )
+    return data
+
 
 class DashboardHandler(AuthHandler):
     """
@@ -37,88 +141,135 @@ class DashboardHandler(AuthHandler):
             self.path_args = args
 
         params = OrderedDict(zip(self.params, args))
-        title = self.dashboard().title % params
 
         if self.request.headers.get("Content-Type") == "application/json":
-            param_dashboard = self.dashboard().parameterized_json(
-                self, **params
-            )
-            param_datasource = []
-            for datasource in self.datasources:
-                # ugly hack to avoid calling the datasource twice per
-                # DashboardPage (once because it's declared in the datasources,
-                # used to automatically register the URLSpecs, and once by the
-                # javascript facility that will look for configuration changes)
-                if datasource.url_name.startswith("datasource_ConfigChanges"):
-                    continue
-
-                value = datasource.parameterized_json(self, **params)
-                value["data_url"] = self.reverse_url(
-                    datasource.url_name, *args
-                )
-                param_datasource.append(value)
-
-            # tell the frontend how to get the configuration changes, if the
-            # DashboardPage provided it
-            param_timeline = None
-            if self.timeline:
-                # Dashboards can specify a subset of arguments to use for the
-                # timeline.
-                if self.timeline_params:
-                    tl_args = [
-                        params[prm]
-                        for prm in self.params
-                        if prm in self.timeline_params
-                    ]
-                else:
-                    tl_args = args
-                param_timeline = self.reverse_url(
-                    self.timeline.url_name, *tl_args
-                )
-
-            last = len(self.breadcrumb) - 1
-            breadcrumbs = [
-                {
-                    "text": item.title,
-                    "href": self.reverse_url(
-                        item.url_name, *item.url_params.values()
-                    ),
-                }
-                for i, item in enumerate(reversed(self.breadcrumb))
-            ] + [
-                {
-                    "text": item.children_title,
-                    "children": (
-                        [
-                            {
-                                "url": self.reverse_url(
-                                    child.url_name, *child.url_params.values()
-                                ),
-                                "title": child.title,
-                            }
-                            for child in item.children
-                        ]
-                        if item.children and i == last
-                        else None
-                    ),
-                }
-                for i, item in enumerate(reversed(self.breadcrumb))
-                if i == last and item.children
-            ]
-
-            return self.render_json(
-                dict(
-                    dashboard=param_dashboard,
-                    datasources=param_datasource,
-                    timeline=param_timeline,
-                    title=title,
-                    breadcrumbs=breadcrumbs,
-                    handler=self.to_json(),
-                )
-            )
+            return self._render_dashboard_json(params, args)
 
+        title = self.dashboard().title % params
         return self.render(self.template, title=title)
 
+    def _get_json_cache_key(self, params, args):
+        """
+        Return the key used to cache the dashboard JSON.  Besides the page and
+        its parameters, the JSON depends on the server capabilities, as the
+        available metrics do, and on the session, as the handler description
+        and the menus do.
+        """
+        srvid = params.get("server", 0)
+        return (
+            type(self).__name__,
+            tuple(args),
+            self.get_capabilities(srvid).fingerprint,
+            self.get_session_key(),
+        )
+
+    def _render_dashboard_json(self, params, args):
+        """
+        Render the JSON description of the dashboard.  It's cached
+        process-wide for dashboard_cache_ttl seconds, and sent with a strong
+        ETag so that the browser only gets a 304 if it already has it.  The
+        dashboard is only built if it's not cached.
+        """
+        cache = self.application.settings.get("dashboard_cache")
+        entry = None
+        if cache is not None:
+            key = self._get_json_cache_key(params, args)
+            entry = cache.get(key)
+
+        if entry is None:
+            body = to_json(self._get_dashboard_json(params, args))
+            etag = '"%s"' % hashlib.sha1(body.encode("utf8")).hexdigest()
+            entry = (etag, body)
+            if cache is not None:
+                cache.set(key, entry)
+
+        etag, body = entry
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            webstats.incr("dashboard_not_modified")
+            self.set_status(304)
+            return
+
+        self.set_header("Content-Type", "application/json")
+        self.write(body)
+
+    def _get_dashboard_json(self, params, args):
+        dashboard = self.dashboard()
+        title = dashboard.title % params
+        param_dashboard = dashboard.parameterized_json(self, **params)
+        param_datasource = []
+        for datasource in self.datasources:
+            # ugly hack to avoid calling the datasource twice per
+            # DashboardPage (once because it's declared in the datasources,
+            # used to automatically register the URLSpecs, and once by the
+            # javascript facility that will look for configuration changes)
+            if datasource.url_name.startswith("datasource_ConfigChanges"):
+                continue
+
+            value = datasource.parameterized_json(self, **params)
+            value["data_url"] = self.reverse_url(datasource.url_name, *args)
+            value["url_name"] = datasource.url_name
+            param_datasource.append(value)
+
+        # tell the frontend how to get the configuration changes, if the
+        # DashboardPage provided it
+        param_timeline = None
+        if self.timeline:
+            # Dashboards can specify a subset of arguments to use for the
+            # timeline.
+            if self.timeline_params:
+                tl_args = [
+                    params[prm]
+                    for prm in self.params
+                    if prm in self.timeline_params
+                ]
+            else:
+                tl_args = args
+            param_timeline = self.reverse_url(self.timeline.url_name, *tl_args)
+
+        last = len(self.breadcrumb) - 1
+        breadcrumbs = [
+            {
+                "text": item.title,
+                "href": self.reverse_url(
+                    item.url_name, *item.url_params.values()
+                ),
+            }
+            for i, item in enumerate(reversed(self.breadcrumb))
+        ] + [
+            {
+                "text": item.children_title,
+                "children": (
+                    [
+                        {
+                            "url": self.reverse_url(
+                                child.url_name, *child.url_params.values()
+                            ),
+                            "title": child.title,
+                        }
+                        for child in item.children
+                    ]
+                    if item.children and i == last
+                    else None
+                ),
+            }
+            for i, item in enumerate(reversed(self.breadcrumb))
+            if i == last and item.children
+        ]
+
+        return dict(
+            dashboard=param_dashboard,
+            datasources=param_datasource,
+            # the metric groups are fetched together with the batch handler,
+            # see DatasourceBatchHandler
+            batch_url=self.reverse_url("datasource_batch"),
+            params=params,
+            timeline=param_timeline,
+            title=title,
+            breadcrumbs=breadcrumbs,
+            handler=self.to_json(),
+        )
+
     @property
     def database(self):
         params = dict(zip(self.params, self.path_args))
@@ -133,8 +284,14 @@ class DashboardHandler(AuthHandler):
     def notify_allowed(self):
         """
         Returns whether the current user is allowed to use the NOTIFY-based
-        communication with powa-collector
+        communication with powa-collector.  Role membership almost never
+        changes, so it's cached with the other session facts.
         """
+        return self.get_session_fact(
+            "notify_allowed", (), self._fetch_notify_allowed
+        )
+
+    def _fetch_notify_allowed(self):
         conn = self.connect()
         cur = conn.cursor()
 
@@ -189,8 +346,13 @@ class MetricGroupHandler(AuthHandler):
     def initialize(self, datasource, params):
         self.params = params
         self.metric_group = datasource
+        self._columnar = False
+        self._binary = False
+        self._streamed = False
+        self._since = None
+        self._downsample = None
 
-    def get(self, *params):
+    async def get(self, *params):
         url_params = dict(zip(self.params, params))
         url_query_params = dict(
             (
@@ -199,25 +361,743 @@ class MetricGroupHandler(AuthHandler):
             )
         )
         url_params.update(url_query_params)
+
+        # The format can be negotiated with the Accept header, so caches must
+        # not serve a response to a request asking for another format
+        self.add_header("Vary", "Accept")
+
+        data = await self.fetch_data(url_params, stream=True)
+        if self._streamed:
+            return
+
+        if self._binary:
+            self.set_header("Content-Type", binary.MEDIA_TYPE)
+            self.write(binary.pack_columnar(data))
+            return
+
+        self.render_json(data)
+
+    async def fetch_data(self, url_params, stream=False):
+        """
+        Return the processed data for the given url parameters, running the
+        queries on the datasource executor or asynchronously, depending on the
+        configuration.
+
+        The data is returned in the columnar format, shaped like {"columns":
+        [...], "ts": [...], "values": {column: [...]}}, if asked for with
+        the format=columnar parameter or the COLUMNAR_MEDIA_TYPE Accept
+        header, for the metric groups using ts as xaxis.  The format=msgpack
+        parameter or the binary.MEDIA_TYPE Accept header also ask for the
+        columnar format, which get() then encodes with binary.pack_columnar().
+
+        If stream is True and the metric group supports it, the rows are
+        instead directly written to the response as they're fetched (see
+        _stream_data()), and None is returned.
+
+        The from and to parameters are snapped to a grid, see _snap_range().
+
+        Metric groups using ts as xaxis also accept a since parameter, see
+        _get_since(), and a downsample parameter, see _get_downsample().
+        """
+        snapped = self._snap_range(url_params)
+        since = self._since = self._get_since(url_params)
+        self._downsample = self._get_downsample(url_params)
+        fmt = self._get_format(url_params)
+        ts_xaxis = getattr(self, "xaxis", "ts") == "ts"
+        self._columnar = fmt in ("columnar", "msgpack") and ts_xaxis
+        self._binary = fmt == "msgpack" and ts_xaxis
         url_params = self.add_params(url_params)
+
+        if stream and self._use_streaming():
+            query = self._get_query(url_params)
+            if query is not None:
+                extra = {} if snapped is None else {"range": snapped}
+                await self._stream_data(query, url_params, extra)
+                return None
+
+        executor = self.application.settings.get("datasource_executor")
+        if executor is not None and not options.async_queries:
+            # Run the queries and the processing on the executor, and only
+            # come back to the IOLoop to render the result.  If post_process
+            # is a coroutine, it's only created in the executor and is awaited
+            # here.
+            data = await executor.run(
+                self.get_executor_srvid(),
+                self.call_releasing,
+                self.get_data,
+                url_params,
+            )
+        else:
+            data = await self.aget_data(url_params)
+
+        if isawaitable(data):
+            data = await data
+
+        if snapped is not None:
+            data["range"] = snapped
+        if since is not None:
+            data["since"] = since
+
+        if self._columnar:
+            data = to_columnar(data)
+        return data
+
+    def _get_range_info(self, url_params):
+        """
+        Return the requested range as a tuple of start and end epoch, the
+        server snapshot frequency and the requested number of samples, or
+        None if any of those is unknown.
+        """
+        if "server" not in url_params:
+            return None
+
+        start = parse_timestamp(url_params.get("from"))
+        end = parse_timestamp(url_params.get("to"))
+        if start is None or end is None or end <= start:
+            return None
+
+        try:
+            descriptor = self.get_server_descriptor(url_params["server"])
+        except Exception:
+            return None
+
+        frequency = descriptor.get("frequency")
+        if not frequency or frequency <= 0:
+            return None
+
+        try:
+            samples = max(int(url_params.get("samples", 100)), 1)
+        except ValueError:
+            return None
+
+        return start, end, frequency, samples
+
+    def _snap_range(self, url_params):
+        """
+        Snap the from and to parameters to a grid, so that the requests for
+        the same range made a few seconds apart, for instance by several
+        viewers of the same page, execute the same query and can share the
+        cached result (see _get_result_cache_key()).
+
+        The grid step is the server snapshot frequency, or a multiple of it
+        for wide ranges, small enough to keep the same number of samples.
+        from is rounded down and to is rounded up, so the snapped range
+        always includes the requested one.  The snapped bounds are returned
+        so they can be sent to the client, or None if the range wasn't
+        snapped.
+        """
+        if not options.snap_ranges:
+            return None
+
+        info = self._get_range_info(url_params)
+        if info is None:
+            return None
+
+        start, end, frequency, samples = info
+        step = frequency * max((end - start) // (frequency * samples), 1)
+        start = start - start % step
+        if end % step:
+            end = end - end % step + step
+
+        url_params["from"] = format_timestamp(start)
+        url_params["to"] = format_timestamp(end)
+        return {"from": url_params["from"], "to": url_params["to"]}
+
+    def _get_since(self, url_params):
+        """
+        Handle the since parameter, the epoch of the last point the client
+        already has, and return it if the data should only be retrieved from
+        that point.
+
+        In that case, the query is executed with since as the lower bound
+        rather than from, so only the new snapshots are processed.  The point
+        at since is returned too, as the client got it without the
+        following snapshot, which is needed to compute its rates, so the
+        client should replace its points starting at since with the returned
+        ones.  The response holds the since value it's based on.
+
+        This is only done for the metric groups using ts as xaxis whose
+        post_process doesn't need the whole range, unless they set
+        incremental to False.  A since that's not a valid timestamp within
+        the requested range is rejected with a 400 error.
+        """
+        since = url_params.pop("since", None)
+        if since is None:
+            return None
+
+        try:
+            since = float(since)
+        except ValueError:
+            since = parse_timestamp(since)
+        if since is None or not math.isfinite(since):
+            raise HTTPError(400, "Invalid since parameter")
+
+        start = parse_timestamp(url_params.get("from"))
+        end = parse_timestamp(url_params.get("to"))
+        if (start is not None and since < start) or (
+            end is not None and since > end
+        ):
+            raise HTTPError(
+                400, "The since parameter must be between from and to"
+            )
+
+        cls = type(self)
+        if (
+            start is None
+            or not self.incremental
+            or getattr(self, "xaxis", "ts") != "ts"
+            or cls.post_process is not MetricGroupHandler.post_process
+        ):
+            return None
+
+        # the point at since must be included despite the rounding errors
+        url_params["from"] = format_timestamp(since - 0.001)
+        webstats.incr("incremental_requests")
+        return since
+
+    def _get_downsample(self, url_params):
+        """
+        Return the downsampling method to use, given by the downsample
+        parameter or the metric group downsample attribute, or None if the
+        rows shouldn't be downsampled.  Downsampling only applies to the
+        metric groups using ts as xaxis, and not to incremental requests.
+        """
+        method = url_params.pop("downsample", None) or self.downsample
+        if method in (None, "none"):
+            return None
+
+        if method not in downsample.METHODS:
+            raise HTTPError(400, "Unknown downsampling method %s" % method)
+
+        if getattr(self, "xaxis", "ts") != "ts" or self._since is not None:
+            return None
+
+        return method
+
+    def _get_fetch_params(self, url_params):
+        """
+        Return the parameters to execute the query with.  If the rows are
+        downsampled, they're fetched with downsample_factor times more
+        samples, or at full resolution if it's 0.
+        """
+        if self._downsample is None:
+            return url_params
+
+        try:
+            samples = max(int(url_params.get("samples", 100)), 1)
+        except ValueError:
+            return url_params
+
+        if options.downsample_factor > 0:
+            samples *= options.downsample_factor
+        else:
+            samples = FULL_RESOLUTION
+        return dict(url_params, samples=samples)
+
+    def _downsample_values(self, values, url_params, tuples):
+        """
+        Reduce each series of the fetched rows to the requested number of
+        samples, see powa.downsample.  The series are identified by the text
+        columns that aren't metrics, if any.
+        """
+        if self._downsample is None or not values:
+            return values
+
+        if tuples:
+            columns, rows = values
+        else:
+            columns, rows = None, values
+        if not rows:
+            return values
+
+        try:
+            samples = max(int(url_params.get("samples", 100)), 1)
+        except ValueError:
+            return values
+
+        names = list(columns if tuples else rows[0].keys())
+        if "ts" not in names:
+            return values
+
+        known = self.metric_group._get_metrics(self, **url_params)
+        name_getters = downsample.getters(columns, names)
+        metrics = [name for name in names if name in known]
+        keys = [
+            name
+            for name, get in zip(names, name_getters)
+            if name not in known and isinstance(get(rows[0]), str)
+        ]
+
+        rows = downsample.downsample(
+            rows,
+            samples,
+            self._downsample,
+            downsample.getters(columns, ["ts"])[0],
+            downsample.getters(columns, metrics),
+            downsample.keygetter(columns, keys),
+        )
+        webstats.incr("downsampled_requests")
+
+        if tuples:
+            return columns, rows
+        return rows
+
+    def _get_format(self, url_params):
+        fmt = url_params.pop("format", None)
+        if fmt is not None:
+            return fmt
+
+        accept = self.request.headers.get("Accept", "")
+        if binary.MEDIA_TYPE in accept:
+            return "msgpack"
+        if COLUMNAR_MEDIA_TYPE in accept:
+            return "columnar"
+        return "json"
+
+    def _use_tuples(self):
+        """
+        Returns whether the columnar format can be built straight from the
+        tuple rows, which is only possible if neither process nor
+        post_process need the rows as dicts.
+        """
+        cls = type(self)
+        return (
+            self._columnar
+            and cls.process is MetricGroupHandler.process
+            and cls.post_process is MetricGroupHandler.post_process
+        )
+
+    def _use_streaming(self):
+        """
+        Returns whether the rows can be streamed, which is only possible for
+        metric groups asking for it, in the regular JSON format, if
+        post_process doesn't need all the rows, if the queries aren't
+        executed asynchronously and if the rows aren't downsampled.
+        """
+        return (
+            self.streaming
+            and options.stream_itersize > 0
+            and not self._columnar
+            and not options.async_queries
+            and type(self).post_process is MetricGroupHandler.post_process
+            and self._downsample is None
+        )
+
+    async def _stream_data(self, query, url_params, extra={}):
+        """
+        Execute the query with a server-side cursor, and write the processed
+        rows as a chunked JSON response as they're fetched, so that the
+        memory used doesn't depend on the number of rows.  The keys of extra
+        are added to the response.  If the datasource
+        executor is enabled, the rows are fetched in its threads.
+        """
+        timeout = self._get_query_timeout()
+        batches = self.execute_batches(
+            query,
+            params=url_params,
+            timeout=timeout,
+            itersize=options.stream_itersize,
+        )
+        executor = self.application.settings.get("datasource_executor")
+        srvid = self.get_executor_srvid()
+
+        self._streamed = True
+        self.set_header("Content-Type", "application/json")
+        # the JSON object with the extra keys, without the closing brace
+        prefix = to_json(dict(extra, data=[]))[: -len("[]}")]
+        nb = 0
+        try:
+            while True:
+                if executor is not None:
+                    rows = await executor.run(srvid, next, batches, None)
+                else:
+                    rows = next(batches, None)
+
+                if rows is None:
+                    break
+
+                chunk = ", ".join(
+                    to_json(self.process(row, **url_params)) for row in rows
+                )
+                self.write((prefix + "[" if nb == 0 else ", ") + chunk)
+                nb += len(rows)
+                await self.flush()
+        except QueryCanceledError:
+            if nb > 0 or self._client_disconnected or not timeout:
+                raise
+            self.write(to_json(dict(extra, **self._timed_out(timeout))))
+            return
+        finally:
+            batches.close()
+
+        webstats.observe("streamed_rows", self.metric_group.__name__, nb)
+        if nb == 0:
+            self.write(prefix + "[]}")
+        else:
+            self.write("]}")
+
+    def _get_query(self, url_params):
+        """
+        Return the query to execute, adding its specific parameters, if any,
+        to url_params.
+        """
         res = self.query
         if res is None:
-            query = None
+            return None
         elif isinstance(res, str):
-            query = res
-        else:
-            query = res[0]
-            url_params.update(res[1])
+            return res
+
+        url_params.update(res[1])
+        return res[0]
+
+    def _get_query_timeout(self):
+        if self.query_timeout is not None:
+            return self.query_timeout
+        return options.query_timeout
+
+    def _timed_out(self, timeout):
+        """
+        Return the response for a query cancelled because it exceeded its
+        statement_timeout.
+        """
+        name = self.metric_group.__name__
+        webstats.observe("datasource_timeouts", name)
+        self.logger.warning(
+            "Query for datasource %s exceeded its %ss budget", name, timeout
+        )
+        return {
+            "messages": {
+                "warning": [
+                    "The query took more than %s seconds and has been "
+                    "cancelled, try with a smaller time interval" % timeout
+                ]
+            },
+            "data": [],
+        }
+
+    def _execute_cached(self, query, params, timeout, tuples):
+        """
+        Return the result of the query for the given parameters, from the
+        result cache if possible.
+        """
+        key = self._get_result_cache_key(query, params, tuples)
+        values = self._get_cached_result(key, tuples)
+        if values is None:
+            values = self.execute(
+                query,
+                params=params,
+                readonly=self.readonly,
+                timeout=timeout,
+                tuples=tuples,
+            )
+            values = self._cache_result(key, values, tuples, params)
+
+        return values
+
+    async def _aexecute_cached(self, query, params, timeout, tuples):
+        """
+        Coroutine version of _execute_cached(), using aexecute().
+        """
+        key = self._get_result_cache_key(query, params, tuples)
+        values = self._get_cached_result(key, tuples)
+        if values is None:
+            values = await self.aexecute(
+                query,
+                params=params,
+                readonly=self.readonly,
+                timeout=timeout,
+                tuples=tuples,
+            )
+            values = self._cache_result(key, values, tuples, params)
+
+        return values
+
+    def _get_tiles(self, url_params):
+        """
+        Return the tiles to fetch for the requested range, as a list of
+        (start, end, params) tuples, or None if the range shouldn't be tiled.
+
+        Each resolution level has a point width of the server snapshot
+        frequency times a power of 2, and its tiles cover tile_points points
+        at fixed positions.  The level used is the most detailed one that
+        returns at most the requested number of samples for the range, and
+        every tile overlapping the range is fetched, so any range is
+        assembled from tiles that other requests can reuse through the
+        result cache.  As the result cache keeps the tiles ending before the
+        last snapshot for long, zooming and panning over past data is mostly
+        served from memory.
+
+        Tiling multiplies the queries of a request, and a range isn't sampled
+        exactly like with a single query, so only the metric groups setting
+        tiled to True are tiled.  They must use ts as xaxis, be able to use
+        the result cache and have a post_process that doesn't need the whole
+        range.  Incremental requests are never tiled.
+        """
+        cls = type(self)
+        if (
+            options.tile_points <= 0
+            or not self.tiled
+            or self._since is not None
+            or getattr(self, "xaxis", "ts") != "ts"
+            or cls.post_process is not MetricGroupHandler.post_process
+            or self.application.settings.get("result_cache") is None
+            or self._get_result_cache_key("", url_params, False) is None
+        ):
+            return None
+
+        info = self._get_range_info(url_params)
+        if info is None:
+            return None
+
+        start, end, width, samples = info
+        while width * samples < end - start:
+            width *= 2
+
+        span = width * options.tile_points
+        first = int(start // span)
+        last = int(end // span)
+        if last - first >= MAX_TILES:
+            return None
+
+        tiles = []
+        for idx in range(first, last + 1):
+            tile_start = idx * span
+            tile_end = tile_start + span
+            # The rates of the last point of a tile are computed with the
+            # next point, so fetch a bit more and ignore the extra points.
+            params = dict(
+                url_params,
+                samples=options.tile_points,
+                **{
+                    "from": format_timestamp(tile_start),
+                    "to": format_timestamp(tile_end + 2 * width),
+                },
+            )
+            tiles.append((tile_start, tile_end, params))
+
+        webstats.incr("tiled_requests")
+        return tiles
+
+    def _merge_tiles(self, results, url_params, tuples):
+        """
+        Assemble the rows of the given (tile, values) list, only keeping
+        the points of each tile within the requested range.
+        """
+        start = parse_timestamp(url_params.get("from"))
+        end = parse_timestamp(url_params.get("to"))
+
+        columns = None
+        rows = []
+        for (tile_start, tile_end, _), values in results:
+            low = max(tile_start, start)
+            if tuples:
+                columns, values = values
+                ts_idx = columns.index("ts")
+                rows.extend(
+                    row
+                    for row in values
+                    if low <= row[ts_idx] < tile_end and row[ts_idx] <= end
+                )
+            else:
+                rows.extend(
+                    row
+                    for row in values
+                    if low <= row["ts"] < tile_end and row["ts"] <= end
+                )
+
+        if tuples:
+            return columns, rows
+        return rows
+
+    def _get_result_cache_key(self, query, url_params, tuples):
+        """
+        Return the key used to cache the result of the given query, or None
+        if it shouldn't be cached.
+
+        The queries are executed on the repository server with the
+        privileges of the role used to connect to it, which is the one set
+        in the server configuration if any, or the logged in user.  As two
+        requests connected with the same role see the same data, the results
+        are shared by all the viewers using the same repository and role.
+        They're never shared across roles, as another role may not have the
+        same privileges on the powa tables.
+        """
+        cache = self.application.settings.get("result_cache")
+        if cache is None or not self.result_cache or not self.readonly:
+            return None
+
+        try:
+            params = tuple(sorted((k, str(v)) for k, v in url_params.items()))
+        except TypeError:
+            return None
+
+        server = self.get_auth("server")
+        servers = getattr(options, "servers", None) or {}
+        role = servers.get(server, {}).get("user") or self.get_auth("user")
+
+        return (
+            server,
+            role,
+            url_params.get("server"),
+            query,
+            params,
+            tuples,
+        )
+
+    def _get_cached_result(self, key, tuples):
+        if key is None:
+            return None
+
+        name = self.metric_group.__name__
+        values = self.application.settings["result_cache"].get(key)
+        if values is None:
+            webstats.observe("result_cache_misses", name)
+            return None
+
+        webstats.observe("result_cache_hits", name)
+        return self._copy_result(values, tuples)
+
+    def _cache_result(self, key, values, tuples, url_params):
+        """
+        Cache the given query result if needed, and return it.  Ranges ending
+        before the last snapshot of the server won't change anymore, until
+        they're purged, so they're kept for result_cache_immutable_ttl
+        seconds rather than result_cache_ttl.
+        """
+        if key is None:
+            return values
+
+        ttl = options.result_cache_ttl
+        srvid = url_params.get("server")
+        to = parse_timestamp(url_params.get("to"))
+        if srvid is not None and to is not None:
+            last_snapshot = self.get_last_snapshot(srvid)
+            if last_snapshot is not None and to < last_snapshot:
+                ttl = options.result_cache_immutable_ttl
+
+        cache = self.application.settings["result_cache"]
+        size = 0
+        if cache.max_bytes is not None:
+            size = self._get_result_size(values, tuples)
+        if not cache.set(key, values, ttl, size):
+            # too big to be cached, so there's no need to copy it
+            return values
+        return self._copy_result(values, tuples)
+
+    def _get_result_size(self, values, tuples):
+        """
+        Return the approximate size of the given query result in bytes,
+        extrapolated from the JSON encoding of its first rows.
+        """
+        if not values:
+            return 0
+
+        rows = values[1] if tuples else values
+        if not rows:
+            return 0
+
+        sample = rows[:RESULT_SIZE_SAMPLE]
+        return len(to_json(sample)) * len(rows) // len(sample)
+
+    def _copy_result(self, values, tuples):
+        # process() is allowed to modify the rows, so it can't be given the
+        # cached ones.  Tuple rows are never modified.
+        if tuples:
+            return values
+        return [dict(row) for row in values]
+
+    def _process_values(self, values, url_params):
         data = {"data": []}
-        if query is not None:
-            values = self.execute(query, params=url_params)
-            if values is not None:
-                data = {
-                    "data": [self.process(val, **url_params) for val in values]
-                }
+        if values is not None:
+            data = {
+                "data": [self.process(val, **url_params) for val in values]
+            }
+        return data
 
-        data = self.post_process(data, **url_params)
-        self.render_json(data)
+    def get_data(self, url_params):
+        """
+        Execute the query and process the result.  The result of
+        post_process is returned as-is, so it can be an awaitable.
+        """
+        query = self._get_query(url_params)
+        timeout = self._get_query_timeout()
+        tuples = self._use_tuples()
+        values = None
+        if query is not None:
+            fetch_params = self._get_fetch_params(url_params)
+            try:
+                tiles = self._get_tiles(fetch_params)
+                if tiles is None:
+                    values = self._execute_cached(
+                        query, fetch_params, timeout, tuples
+                    )
+                else:
+                    values = self._merge_tiles(
+                        [
+                            (
+                                tile,
+                                self._execute_cached(
+                                    query, tile[2], timeout, tuples
+                                ),
+                            )
+                            for tile in tiles
+                        ],
+                        fetch_params,
+                        tuples,
+                    )
+            except QueryCanceledError:
+                if self._client_disconnected or not timeout:
+                    raise
+                return self._timed_out(timeout)
+
+            values = self._downsample_values(values, url_params, tuples)
+            if tuples:
+                return rows_to_columnar(*values)
+        data = self._process_values(values, url_params)
+
+        return self.post_process(data, **url_params)
+
+    async def aget_data(self, url_params):
+        """
+        Coroutine version of get_data(), using aexecute().
+        """
+        query = self._get_query(url_params)
+        timeout = self._get_query_timeout()
+        tuples = self._use_tuples()
+        values = None
+        if query is not None:
+            fetch_params = self._get_fetch_params(url_params)
+            try:
+                tiles = self._get_tiles(fetch_params)
+                if tiles is None:
+                    values = await self._aexecute_cached(
+                        query, fetch_params, timeout, tuples
+                    )
+                else:
+                    values = self._merge_tiles(
+                        [
+                            (
+                                tile,
+                                await self._aexecute_cached(
+                                    query, tile[2], timeout, tuples
+                                ),
+                            )
+                            for tile in tiles
+                        ],
+                        fetch_params,
+                        tuples,
+                    )
+            except QueryCanceledError:
+                if self._client_disconnected or not timeout:
+                    raise
+                return self._timed_out(timeout)
+
+            values = self._downsample_values(values, url_params, tuples)
+            if tuples:
+                return rows_to_columnar(*values)
+        data = self._process_values(values, url_params)
+
+        return self.post_process(data, **url_params)
 
     def add_params(self, params):
         return params
@@ -241,7 +1121,8 @@ class MetricGroupHandler(AuthHandler):
     def post_process(self, data, **kwargs):
         """
         Callback used to process the whole set of rows before returning
-        it to the browser.
+        it to the browser.  It can also be a coroutine, for instance if it
+        needs to call aexecute().
 
         Arguments:
             handler (tornado.web.RequestHandler):
@@ -256,6 +1137,124 @@ class MetricGroupHandler(AuthHandler):
         return data
 
 
+class DatasourceBatchHandler(AuthHandler):
+    """
+    Handler running a set of metric groups in a single request.
+
+    The body is a JSON object with a "datasources" list of datasource url
+    names and a "params" object holding both the url parameters (server,
+    database...) and the query parameters (from, to...) shared by all the
+    datasources.  An optional "datasource_params" object can hold the query
+    parameters specific to some of the datasources, like since, by url name.
+    They're executed with a bounded parallelism, each with its own
+    connections, and each result is sent as soon as it's available as a line
+    of JSON holding either the datasource "data" or an "error".
+    """
+
+    def initialize(self):
+        self._handlers = []
+
+    def _get_handler(self, name, params):
+        """
+        Return a MetricGroupHandler for the given datasource url name, bound
+        to the current request.
+        """
+        rule = self.application.wildcard_router.named_rules.get(name)
+        if rule is None or not issubclass(rule.target, MetricGroupHandler):
+            raise HTTPError(404, "Unknown datasource %s" % name)
+
+        handler = rule.target(
+            self.application, self.request, **rule.target_kwargs
+        )
+        # Creating a handler steals the connection close callback
+        self.request.connection.set_close_callback(self.on_connection_close)
+
+        missing = [p for p in handler.params if p not in params]
+        if missing:
+            raise HTTPError(
+                400, "Missing parameters for %s: %s" % (name, missing)
+            )
+        handler.path_args = [params[p] for p in handler.params]
+        # make sure the parameters are valid for the datasource url
+        path = self.reverse_url(name, *handler.path_args)
+        if rule.matcher.regex.match(path) is None:
+            raise HTTPError(400, "Invalid parameters for %s" % name)
+
+        # The per-request caches can be shared by all the datasources
+        handler._capabilities = self._capabilities
+        handler._session_facts = self._session_facts
+        handler._server_descriptors = self._server_descriptors
+
+        self._handlers.append(handler)
+        return handler
+
+    async def _run(self, semaphore, name, handler, params):
+        async with semaphore:
+            try:
+                data = await handler.fetch_data(dict(params))
+                return {"datasource": name, "data": data}
+            except Exception as e:
+                if self._client_disconnected:
+                    raise
+                self.logger.error(
+                    "Error in batched datasource %s: %s", name, e
+                )
+                return {"datasource": name, "error": str(e)}
+            finally:
+                # give the connections back as soon as possible, for the
+                # other datasources
+                handler.on_finish()
+
+    async def post(self):
+        try:
+            payload = json.loads(self.request.body.decode("utf8"))
+            names = list(payload["datasources"])
+            params = {k: str(v) for k, v in payload.get("params", {}).items()}
+            own_params = {
+                name: dict(params, **{k: str(v) for k, v in prms.items()})
+                for name, prms in payload.get("datasource_params", {}).items()
+            }
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise HTTPError(400, "Invalid batch request: %s" % e)
+
+        handlers = [(name, self._get_handler(name, params)) for name in names]
+
+        webstats.incr("batch_requests")
+        webstats.incr("batch_datasources", len(handlers))
+
+        semaphore = Semaphore(max(options.batch_max_parallel, 1))
+        tasks = [
+            asyncio.ensure_future(
+                self._run(
+                    semaphore, name, handler, own_params.get(name, params)
+                )
+            )
+            for name, handler in handlers
+        ]
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        try:
+            for task in asyncio.as_completed(tasks):
+                self.write(to_json(await task) + "\n")
+                await self.flush()
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            if self._client_disconnected:
+                return
+            raise
+
+    def on_connection_close(self):
+        super(DatasourceBatchHandler, self).on_connection_close()
+        for handler in self._handlers:
+            handler.on_connection_close()
+
+    def on_finish(self):
+        for handler in self._handlers:
+            handler.on_finish()
+        super(DatasourceBatchHandler, self).on_finish()
+
+
 class DataSource(JSONizable):
     """
     Base class for various datasources
@@ -632,6 +1631,28 @@ class MetricGroupDef(with_metaclass(MetaMetricGroup, DataSource)):
     """
 
     _inst = None
+    # Execute the query in read-only mode, see BaseHandler.execute()
+    readonly = True
+    # Maximum duration of the query in seconds, 0 for no limit, defaulting to
+    # the query_timeout option.  If it's exceeded, a warning is returned
+    # instead of the data.
+    query_timeout = None
+    # Fetch and send the rows by batches, for the metric groups that can
+    # return a lot of rows, see MetricGroupHandler._stream_data()
+    streaming = False
+    # Cache the query results, see MetricGroupHandler._cache_result()
+    result_cache = True
+    # Accept the since parameter, see MetricGroupHandler._get_since()
+    incremental = True
+    # Fetch the range by tiles, see MetricGroupHandler._get_tiles()
+    tiled = False
+    # One of powa.downsample.METHODS, to fetch the rows of a time-series
+    # metric group at a higher resolution and keep their peaks, see
+    # MetricGroupHandler._downsample_values()
+    downsample = None
+    # "rows" or "buckets", passed to the sampled history queries of
+    # powa.sql.views_graph, see powa.sql.views_graph.sample_history()
+    sampling = "rows"
     datasource_handler_cls = MetricGroupHandler
 
     @classmethod
@@ -646,7 +1667,8 @@ class MetricGroupDef(with_metaclass(MetaMetricGroup, DataSource)):
         values["type"] = "metric_group"
         values.setdefault("xaxis", "ts")
         values["metrics"] = list(cls.metrics.values())
-        values.pop("query", None)
+        for key in SERVER_ONLY_ATTRIBUTES:
+            values.pop(key, None)
         return values
 
     @classmethod
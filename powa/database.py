@@ -62,6 +62,11 @@ class DatabaseOverviewMetricGroup(MetricGroupDef):
     name = "database_overview"
     xaxis = "ts"
     data_url = r"/server/(\d+)/metrics/database_overview/([^\/]+)/"
+    # the kcache metrics are joined on ts, see
+    # powa.sql.views_graph.sample_history()
+    sampling = "buckets"
+    # keep the peaks of the dense time-series, see powa.downsample
+    downsample = "lttb"
     avg_runtime = MetricDef(
         label="Avg runtime", type="duration", desc="Average query duration"
     )
@@ -248,7 +253,9 @@ class DatabaseOverviewMetricGroup(MetricGroupDef):
     @property
     def query(self):
         # Fetch the base query for sample, and filter them on the database
-        query = powa_getstatdata_sample("db", ["datname = %(database)s"])
+        query = powa_getstatdata_sample(
+            "db", ["datname = %(database)s"], sampling=self.sampling
+        )
 
         cols = [
             "srvid",
@@ -309,7 +316,7 @@ class DatabaseOverviewMetricGroup(MetricGroupDef):
 
             # Add system metrics from pg_stat_kcache,
             kcache_query = kcache_getstatdata_sample(
-                "db", ["datname = %(database)s"]
+                "db", ["datname = %(database)s"], sampling=self.sampling
             )
 
             total_sys_hit = (
@@ -480,7 +487,9 @@ class DatabaseWaitOverviewMetricGroup(MetricGroupDef):
 
     @property
     def query(self):
-        query = powa_getwaitdata_sample("db", ["datname = %(database)s"])
+        query = powa_getwaitdata_sample(
+            "db", ["datname = %(database)s"], sampling=self.sampling
+        )
 
         cols = [to_epoch("ts")]
 
@@ -800,6 +809,7 @@ class ByQueryMetricGroup(MetricGroupDef):
     xaxis = "queryid"
     axis_type = "category"
     data_url = r"/server/(\d+)/metrics/database_all_queries/([^\/]+)/"
+    streaming = True
     plantime = MetricDef(label="Plantime", type="duration")
     calls = MetricDef(label="#", type="integer")
     runtime = MetricDef(label="Time", type="duration", direction="descending")
@@ -919,6 +929,7 @@ class ByQueryWaitSamplingMetricGroup(MetricGroupDef):
     xaxis = "query"
     axis_type = "category"
     data_url = r"/server/(\d+)/metrics/database_all_queries_waits/([^\/]+)/"
+    streaming = True
     counts = MetricDef(
         label="# of events", type="integer", direction="descending"
     )
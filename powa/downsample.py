@@ -0,0 +1,236 @@
+"""
+Peak-preserving downsampling of the time-series.
+
+The rows are fetched at a higher resolution than requested, and each series
+is then reduced to the requested number of points with one of the METHODS:
+
+    lttb:
+        Largest-Triangle-Three-Buckets, keeping in each bucket the point
+        forming the largest triangle with the points kept in the surrounding
+        buckets, which follows the shape of the series.
+    minmax:
+        keep the lowest and the highest point of each bucket.
+
+Both keep real rows rather than computing new ones, so all the metrics of a
+row stay consistent.  As all the metrics of a metric group share the same
+rows, the points are chosen on the envelope of the metrics, each one being
+scaled to its range, so that a spike of any of them is kept.
+
+NumPy is used for LTTB and the envelope if it's installed, and a pure Python
+implementation otherwise.
+"""
+
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _to_float(value):
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _bucket_bounds(length, buckets):
+    """
+    Return the (start, end) bounds of the given number of buckets splitting
+    the points between the first and the last ones.
+    """
+    every = (length - 2) / buckets
+    return [
+        (int(i * every) + 1, int((i + 1) * every) + 1) for i in range(buckets)
+    ]
+
+
+def _lttb_python(x, y, threshold):
+    bounds = _bucket_bounds(len(x), threshold - 2)
+    kept = [0]
+    prev = 0
+    for i, (start, end) in enumerate(bounds):
+        # the next point is the average of the next bucket, or the last point
+        if i + 1 < len(bounds):
+            nstart, nend = bounds[i + 1]
+        else:
+            nstart, nend = len(x) - 1, len(x)
+        count = nend - nstart
+        avg_x = sum(x[nstart:nend]) / count
+        avg_y = sum(y[nstart:nend]) / count
+
+        px, py = x[prev], y[prev]
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs((px - avg_x) * (y[j] - py) - (px - x[j]) * (avg_y - py))
+            if area > best_area:
+                best = j
+                best_area = area
+
+        kept.append(best)
+        prev = best
+
+    kept.append(len(x) - 1)
+    return kept
+
+
+def _lttb_numpy(x, y, threshold):
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    bounds = _bucket_bounds(len(x), threshold - 2)
+    kept = [0]
+    prev = 0
+    for i, (start, end) in enumerate(bounds):
+        if i + 1 < len(bounds):
+            nstart, nend = bounds[i + 1]
+        else:
+            nstart, nend = len(x) - 1, len(x)
+        avg_x = x[nstart:nend].mean()
+        avg_y = y[nstart:nend].mean()
+
+        px, py = x[prev], y[prev]
+        areas = numpy.abs(
+            (px - avg_x) * (y[start:end] - py)
+            - (px - x[start:end]) * (avg_y - py)
+        )
+        prev = start + int(areas.argmax())
+        kept.append(prev)
+
+    kept.append(len(x) - 1)
+    return kept
+
+
+def lttb(x, y, threshold):
+    """
+    Return the sorted indexes of the threshold points to keep from the given
+    series, using the Largest-Triangle-Three-Buckets algorithm.
+    """
+    if threshold >= len(x) or threshold < 3:
+        return list(range(len(x)))
+
+    if numpy is not None:
+        return _lttb_numpy(x, y, threshold)
+    return _lttb_python(x, y, threshold)
+
+
+def _minmax(y, buckets):
+    kept = [0]
+    for start, end in _bucket_bounds(len(y), buckets):
+        if start >= end:
+            continue
+        values = y[start:end]
+        low = start + values.index(min(values))
+        high = start + values.index(max(values))
+        kept.extend(sorted({low, high}))
+
+    kept.append(len(y) - 1)
+    return kept
+
+
+def minmax(x, y, threshold):
+    """
+    Return the sorted indexes of at most threshold points to keep from the
+    given series, keeping the lowest and highest point of each bucket.
+    """
+    if threshold >= len(y) or threshold < 4:
+        return list(range(len(y)))
+
+    # min() and max() on lists are faster than converting them to arrays
+    return _minmax(y, (threshold - 2) // 2)
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def envelope(rows, metrics):
+    """
+    Return, for each of the given rows, the maximum of the given metrics
+    getters, each metric being scaled to its range so that a constant metric
+    doesn't hide the variations of the others.
+    """
+    if not metrics:
+        return [0.0] * len(rows)
+
+    if numpy is not None:
+        values = numpy.array(
+            [[_to_float(get(row)) for get in metrics] for row in rows],
+            dtype=float,
+        ).reshape(len(rows), len(metrics))
+        low = values.min(axis=0)
+        scale = values.max(axis=0) - low
+        scale[scale == 0] = 1
+        return ((values - low) / scale).max(axis=1).tolist()
+
+    columns = [[_to_float(get(row)) for row in rows] for get in metrics]
+    ranges = [(min(col), (max(col) - min(col)) or 1) for col in columns]
+    return [
+        max(
+            (col[i] - low) / scale
+            for col, (low, scale) in zip(columns, ranges)
+        )
+        for i in range(len(rows))
+    ]
+
+
+def downsample(rows, threshold, method, ts, metrics, key=None):
+    """
+    Reduce each series of the given rows to threshold points with the given
+    method, keeping the rows order.
+
+    Arguments:
+        rows (list):
+            the rows, sorted by ts within each series
+        threshold (int):
+            the number of points to keep per series
+        method (str):
+            one of METHODS
+        ts (callable):
+            returns the ts of a row, as a number
+        metrics (list):
+            callables returning the value of each metric of a row
+        key (callable):
+            returns the series a row belongs to, if there are several
+    """
+    if len(rows) <= threshold:
+        return rows
+
+    series = {}
+    for i, row in enumerate(rows):
+        series.setdefault(None if key is None else key(row), []).append(i)
+
+    select = METHODS[method]
+    kept = []
+    for indexes in series.values():
+        srows = [rows[i] for i in indexes]
+        x = [_to_float(ts(row)) for row in srows]
+        y = envelope(srows, metrics)
+        kept.extend(indexes[i] for i in select(x, y, threshold))
+
+    return [rows[i] for i in sorted(kept)]
+
+
+def getters(columns, names):
+    """
+    Return the itemgetters of the given names, for tuple rows with the given
+    columns, or for dict rows if columns is None.
+    """
+    if columns is None:
+        return [itemgetter(name) for name in names]
+    return [itemgetter(columns.index(name)) for name in names]
+
+
+def keygetter(columns, names):
+    """
+    Return a callable returning the values of the given names as the series
+    key, for tuple rows with the given columns, or for dict rows if columns
+    is None.  None is returned if there are no such names.
+    """
+    if not names:
+        return None
+    if columns is None:
+        return itemgetter(*names)
+    return itemgetter(*[columns.index(name) for name in names])
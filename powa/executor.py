@@ -0,0 +1,85 @@
+"""
+Bounded thread pool used to run the datasources outside of the IOLoop.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+
+
+class DatasourceExecutor(object):
+    """
+    Run blocking functions, typically a datasource database work, on a
+    bounded pool of threads.
+
+    The number of functions running or queued for a single server can be
+    limited with max_per_server, so that a single overloaded remote server
+    can't use all the workers.  Functions waiting for a per-server slot don't
+    use a worker.
+
+    This object must only be used from the IOLoop thread.
+    """
+
+    def __init__(self, max_workers, max_per_server=0):
+        self.max_workers = max_workers
+        self.max_per_server = max_per_server
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="powa-datasource"
+        )
+        self._semaphores = {}
+        # srvid -> number of functions waiting for a per-server slot
+        self._waiting = defaultdict(int)
+        # srvid -> number of functions submitted to the thread pool
+        self._submitted = defaultdict(int)
+
+    def _get_semaphore(self, srvid):
+        if srvid not in self._semaphores:
+            self._semaphores[srvid] = Semaphore(self.max_per_server)
+        return self._semaphores[srvid]
+
+    async def run(self, srvid, fn, *args):
+        """
+        Run fn(*args) on the thread pool, counting it against the given
+        server limit, and return its result.
+        """
+        srvid = str(srvid)
+
+        if self.max_per_server > 0:
+            self._waiting[srvid] += 1
+            try:
+                await self._get_semaphore(srvid).acquire()
+            finally:
+                self._waiting[srvid] -= 1
+
+        self._submitted[srvid] += 1
+        try:
+            return await IOLoop.current().run_in_executor(
+                self._executor, fn, *args
+            )
+        finally:
+            self._submitted[srvid] -= 1
+            if self.max_per_server > 0:
+                self._get_semaphore(srvid).release()
+
+    def stats(self):
+        """
+        Return the current queue depths, globally and per server.
+        """
+        submitted = sum(self._submitted.values())
+        per_server = {}
+        for srvid in set(self._waiting) | set(self._submitted):
+            if self._waiting[srvid] or self._submitted[srvid]:
+                per_server[srvid] = {
+                    "waiting": self._waiting[srvid],
+                    "submitted": self._submitted[srvid],
+                }
+
+        return {
+            "max_workers": self.max_workers,
+            "max_per_server": self.max_per_server,
+            "running": min(submitted, self.max_workers),
+            "queued": max(submitted - self.max_workers, 0),
+            "waiting": sum(self._waiting.values()),
+            "per_server": per_server,
+        }
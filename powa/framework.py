@@ -2,19 +2,36 @@
 Utilities for the basis of Powa
 """
 
+import hashlib
+import json
 import logging
 import pickle
 import psycopg2
-import random
-import re
-import select
+import threading
 import time
-from collections import defaultdict
-from powa import ui_methods
+from powa import ui_methods, webstats
+from powa.breaker import ServerUnavailable, is_connection_failure
+from powa.capabilities import (
+    ServerCapabilities,
+    parse_version,
+    parse_version_num,
+)
 from powa.json import JSONizable, to_json
+from powa.listener import CollectorListener, CollectorStatusPoller
+from powa.pool import PoolTimeout
+from psycopg2.extensions import (
+    POLL_OK,
+    POLL_READ,
+    POLL_WRITE,
+    TRANSACTION_STATUS_IDLE,
+    QueryCanceledError,
+)
 from psycopg2.extensions import connection as _connection
 from psycopg2.extensions import cursor as _cursor
 from psycopg2.extras import RealDictCursor
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
 from tornado.options import options
 from tornado.web import HTTPError, RequestHandler, authenticated
 
@@ -25,14 +42,23 @@ class CustomConnection(_connection):
     schema and optionally logs various information at debug level, both on
     successful execution and in case of error.
 
-    Supports either plain cursor (through CustomCursor) or RealDictCursor
-    (through CustomDictCursor).
+    Supports either plain cursor (through CustomCursor), RealDictCursor
+    (through CustomDictCursor) or CustomTupleCursor.
 
     Before execution, and if a _nsps object is found cached in the connection,
     the query will be formatted using this _nsps dict, which contains a list of
     extension_name -> escaped_schema_name mapping.
     All you need to do is pass query strings of the form
     SELECT ... FROM {extension_name}.some_relation ...
+
+    Connections can be shared across requests through the connection pool.
+    Code changing the session state in a way that reset_session() can't undo
+    (e.g. creating hypothetical indexes) should set _reusable to False so the
+    connection is closed rather than given back to the pool.
+
+    The same class is used for asynchronous connections (see
+    BaseHandler.aconnect()), in which case the client encoding has to be
+    provided as a connection option rather than through set_client_encoding().
     """
 
     def initialize(self, logger, srvid, dsn, encoding_query, debug):
@@ -40,10 +66,63 @@ class CustomConnection(_connection):
         self._srvid = srvid or 0
         self._dsn = dsn
         self._debug = debug
+        self._encoding_query = encoding_query
+        self._reusable = True
+        # statement_timeout in ms set by get_timeout_query(), None if the
+        # server default is used and -1 if unknown
+        self._statement_timeout = None
 
         if encoding_query is not None:
             self.set_client_encoding(encoding_query["client_encoding"])
 
+    def reset_session(self):
+        """
+        Discard any transaction and session state, so that the connection can
+        safely be reused by another request.
+        """
+        # Asynchronous connections are always in autocommit mode and can't
+        # run synchronous commands, we only need to make sure that nothing is
+        # still running.
+        if self.async_:
+            if self.isexecuting():
+                raise Exception("A query is still running")
+            return
+
+        if self.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self.rollback()
+
+        self.autocommit = True
+        cur = _cursor(self)
+        cur.execute("DISCARD ALL")
+        cur.close()
+        self.autocommit = False
+        self._statement_timeout = None
+
+        if self._encoding_query is not None:
+            self.set_client_encoding(self._encoding_query["client_encoding"])
+
+    def rollback(self):
+        super(CustomConnection, self).rollback()
+        # the statement_timeout may have been changed in the transaction
+        if getattr(self, "_statement_timeout", None) is not None:
+            self._statement_timeout = -1
+
+    def get_timeout_query(self, timeout):
+        """
+        Return the statement to execute so that the next queries use the
+        given statement_timeout, in seconds, or None if it's already in use.
+        A timeout of 0 or None means the server default.  The caller should
+        restore the previous _statement_timeout if that statement fails.
+        """
+        wanted = int(timeout * 1000) if timeout else None
+        if wanted == getattr(self, "_statement_timeout", None):
+            return None
+
+        self._statement_timeout = wanted
+        if wanted is None:
+            return "RESET statement_timeout"
+        return "SET statement_timeout = %d" % wanted
+
     def cursor(self, *args, **kwargs):
         factory = kwargs.get("cursor_factory")
 
@@ -51,6 +130,8 @@ class CustomConnection(_connection):
             kwargs["cursor_factory"] = CustomCursor
         elif factory == RealDictCursor:
             kwargs["cursor_factory"] = CustomDictCursor
+        elif factory == CustomTupleCursor:
+            pass
         else:
             msg = "Unsupported cursor_factory: %s" % factory.__name__
             self._logger.error(msg)
@@ -73,6 +154,25 @@ class CustomDictCursor(RealDictCursor):
             log_query(self, query, params)
 
 
+class CustomTupleCursor(_cursor):
+    """
+    Plain cursor returning tuples, which unlike CustomCursor raises the
+    errors.
+    """
+
+    def execute(self, query, params=None):
+        query = resolve_nsps(query, self.connection)
+
+        self.timestamp = time.time()
+        try:
+            return super(CustomTupleCursor, self).execute(query, params)
+        except Exception as e:
+            log_query(self, query, params, e)
+            raise e
+        finally:
+            log_query(self, query, params)
+
+
 class CustomCursor(_cursor):
     def execute(self, query, params=None):
         query = resolve_nsps(query, self.connection)
@@ -86,6 +186,16 @@ class CustomCursor(_cursor):
             log_query(self, query, params)
 
 
+def get_columns(cursor):
+    """
+    Return the list of column names of the last query executed by the given
+    cursor, or None if it didn't return rows.
+    """
+    if cursor.description is None:
+        return None
+    return [col[0] for col in cursor.description]
+
+
 def resolve_nsps(query, connection):
     try:
         if hasattr(connection, "_nsps"):
@@ -96,6 +206,37 @@ def resolve_nsps(query, connection):
     return query
 
 
+async def wait_async(conn):
+    """
+    Wait until the given asynchronous connection is ready, without blocking the
+    IOLoop.  Any error raised by the pending operation is propagated.
+    """
+    ioloop = IOLoop.current()
+    while True:
+        state = conn.poll()
+        if state == POLL_OK:
+            return
+        elif state == POLL_READ:
+            events = IOLoop.READ
+        elif state == POLL_WRITE:
+            events = IOLoop.WRITE
+        else:
+            raise psycopg2.OperationalError("Unexpected poll state %s" % state)
+
+        future = Future()
+
+        def ready(fd, events):
+            if not future.done():
+                future.set_result(None)
+
+        fd = conn.fileno()
+        ioloop.add_handler(fd, ready, events)
+        try:
+            await future
+        finally:
+            ioloop.remove_handler(fd)
+
+
 def log_query(cls, query, params=None, exception=None):
     t = round((time.time() - cls.timestamp) * 1000, 2)
 
@@ -127,10 +268,19 @@ class BaseHandler(RequestHandler, JSONizable):
     def __init__(self, *args, **kwargs):
         super(BaseHandler, self).__init__(*args, **kwargs)
         self.flashed_messages = {}
-        self._databases = None
-        self._servers = None
         self._connections = {}
-        self._ext_versions = defaultdict(lambda: defaultdict(dict))
+        self._aconnections = {}
+        # connections currently executing a query for this request
+        self._running_conns = set()
+        self._client_disconnected = False
+        # capabilities already retrieved during this request
+        self._capabilities = {}
+        # session facts already retrieved during this request
+        self._session_facts = {}
+        # servers description already retrieved during this request
+        self._server_descriptors = {}
+        # handlers are created on the IOLoop thread
+        self._ioloop_thread = threading.get_ident()
         self.url_prefix = options.url_prefix
         self.logger = logging.getLogger("tornado.application")
         if self.application.settings["debug"]:
@@ -168,23 +318,138 @@ class BaseHandler(RequestHandler, JSONizable):
         Return the current_user if he is allowed to connect
         to his server of choice.
         """
-        raw = self.get_str_cookie("user")
+        raw = self.get_auth("user")
         if raw is not None:
-            try:
-                self.connect()
+            # Credentials validated recently don't need to be checked again
+            cache = self.application.settings.get("auth_cache")
+            key = self.get_session_key()
+            if cache is not None and cache.get(key):
                 return raw or "anonymous"
-            except Exception:
+
+            # A stale cookie can refer to a server that's not configured
+            # anymore, which just means that the user has to log in again.
+            if self.get_auth("server") not in options.servers:
+                return None
+
+            # Only an authentication failure means that the user isn't
+            # logged in, errors like a pool timeout or an unavailable server
+            # are reported as such.  Without the cache, the credentials are
+            # checked on every request, so it's done through the pool.
+            try:
+                self.check_credentials(pooled=cache is None)
+            except psycopg2.OperationalError:
+                self.invalidate_auth()
+                return None
+
+            if cache is not None:
+                cache.set(key, True)
+            return raw or "anonymous"
+
+    def check_credentials(
+        self, server=None, user=None, password=None, pooled=False
+    ):
+        """
+        Check that the given credentials, or the current user ones, are
+        valid.  Raises psycopg2.OperationalError if they're not.
+
+        Unless pooled is True, a new connection is opened and closed rather
+        than leasing one from the pool, as pooled connections have already
+        been authenticated and would keep working if the role was dropped,
+        altered with NOLOGIN or if its password changed or expired.  If
+        pooled is True, a connection is leased with connect() and kept for
+        the rest of the request, which avoids a new connection per request
+        but only notices such changes once the pooled connections are
+        closed.
+        """
+        if pooled:
+            self.connect(server=server, user=user, password=password)
+            return
+
+        connoptions, _, _ = self.__get_connoptions(
+            None, server, user, password, None, False
+        )
+        conn = psycopg2.connect(**connoptions)
+        conn.close()
+
+    def get_auth(self, name):
+        """
+        Return the given authentication information (user, password or
+        server) of the current user.  It's stored in the cookies, or in the
+        session if server_side_sessions is enabled.
+        """
+        if options.server_side_sessions:
+            store = self.application.settings["session_store"]
+            session = store.get(self.get_str_cookie("session"))
+            if session is None:
                 return None
+            return session.get(name)
+
+        return self.get_str_cookie(name)
+
+    def get_session_key(self, server=None, user=None, password=None):
+        """
+        Return a key identifying the current user session, derived from its
+        credentials so that it changes if any of them changes.  The given
+        credentials are used instead of the current user ones if provided.
+        """
+        given = {"server": server, "user": user, "password": password}
+        credentials = "\0".join(
+            (given[name] if given[name] is not None else self.get_auth(name))
+            or ""
+            for name in ("server", "user", "password")
+        )
+        return hashlib.sha256(credentials.encode("utf8")).hexdigest()
+
+    def invalidate_auth(self, server=None, user=None, password=None):
+        """
+        Forget that the given credentials, or the current user ones, have
+        been validated, and everything cached for that session.
+        """
+        key = self.get_session_key(server, user, password)
+        cache = self.application.settings.get("auth_cache")
+        if cache is not None:
+            cache.delete(key)
+
+        session_cache = self.application.settings.get("session_cache")
+        if session_cache is not None:
+            session_cache.invalidate(session=key)
+        self._session_facts = {}
+
+    def get_session_fact(self, name, args, fetch):
+        """
+        Return the named fact about the current session, like the list of
+        databases of a server, computing it with the given fetch function if
+        needed.  The result is cached for the duration of the request, and
+        process-wide for session_cache_ttl seconds.
+        """
+        key = (name,) + tuple(args)
+        if key not in self._session_facts:
+            cache = self.application.settings.get("session_cache")
+            if cache is None:
+                value = fetch()
+            else:
+                value = cache.get(self.get_session_key(), name, args, fetch)
+            self._session_facts[key] = value
+
+        return self._session_facts[key]
+
+    def invalidate_session_facts(self, name):
+        """
+        Forget the named fact for all the sessions.
+        """
+        session_cache = self.application.settings.get("session_cache")
+        if session_cache is not None:
+            session_cache.invalidate(name=name)
+
+        for key in [k for k in self._session_facts if k[0] == name]:
+            del self._session_facts[key]
 
     @property
     def current_server(self):
         """
         Return the server connected to if any
         """
-        try:
-            return self.get_secure_cookie("server").decode("utf-8")
-        except AttributeError:
-            return None
+        return self.get_auth("server")
 
     @property
     def current_host(self):
@@ -256,6 +521,7 @@ class BaseHandler(RequestHandler, JSONizable):
             FROM pg_extension
             WHERE extname = 'powa'
             """,
+            readonly=True,
             **kwargs,
         )
 
@@ -268,6 +534,9 @@ class BaseHandler(RequestHandler, JSONizable):
         return [int(part) for part in version.split(".")]
 
     def get_pg_version_num(self, srvid=None, **kwargs):
+        if not kwargs:
+            return self.get_capabilities(srvid).pg_version_num
+
         try:
             return int(
                 self.execute(
@@ -277,6 +546,7 @@ class BaseHandler(RequestHandler, JSONizable):
                 WHERE name = 'server_version_num'
                 """,
                     srvid=srvid,
+                    readonly=True,
                     **kwargs,
                 )[0]["setting"]
             )
@@ -288,8 +558,9 @@ class BaseHandler(RequestHandler, JSONizable):
         Return the list of databases in this instance.
         """
         if self.current_user:
-            if self._databases is None:
-                self._databases = [
+
+            def fetch():
+                return [
                     d["datname"]
                     for d in self.execute(
                         """
@@ -301,24 +572,106 @@ class BaseHandler(RequestHandler, JSONizable):
                     ORDER BY DATNAME
                     """,
                         params={"srvid": srvid},
+                        readonly=True,
                     )
                 ]
-            return self._databases
+
+            return self.get_session_fact("databases", (str(srvid),), fetch)
+
+    def get_server_descriptors(self, server=None, user=None, password=None):
+        """
+        Return a dict of srvid (as a string) -> description of all the servers
+        declared on the repository server, as found in the powa_servers table.
+
+        All the servers are loaded at once and cached process-wide, per
+        repository server and user, for servers_cache_ttl seconds or until
+        powa-collector configuration is reloaded, so that connecting to a
+        remote server doesn't need to query the repository server first.
+        """
+        server = server or self.get_auth("server")
+        user = user or self.get_auth("user")
+        key = (server, user)
+
+        if key in self._server_descriptors:
+            return self._server_descriptors[key]
+
+        cache = self.application.settings.get("servers_cache")
+        descriptors = None
+        if cache is not None:
+            descriptors = cache.get(key)
+
+        if descriptors is None:
+            rows = self.execute(
+                """
+            SELECT id, hostname, port, username, password, dbname, alias,
+                allow_ui_connection, frequency
+            FROM {powa}.powa_servers
+            """,
+                server=server,
+                user=user,
+                password=password,
+                readonly=True,
+            )
+            descriptors = {str(row["id"]): dict(row) for row in rows}
+
+            if cache is not None:
+                cache.set(key, descriptors)
+
+        self._server_descriptors[key] = descriptors
+        return descriptors
+
+    def get_server_descriptor(self, srvid, **kwargs):
+        """
+        Return the description of the given server.  If it's unknown, the
+        cached servers are loaded again in case it was just added, and a 404
+        error is raised if it still doesn't exist.
+
+        The shared cache is only flushed for an unknown server once per
+        servers_cache_ttl, so that requests for a nonexistent server don't
+        make everyone else query the repository server again.
+        """
+        srvid = str(srvid)
+        descriptor = self.get_server_descriptors(**kwargs).get(srvid)
+        if descriptor is None:
+            cache = self.application.settings.get("servers_cache")
+            # the first item is the repository server, so that the marker is
+            # also forgotten by invalidate_servers()
+            reloaded = (
+                kwargs.get("server") or self.get_auth("server"),
+                kwargs.get("user") or self.get_auth("user"),
+                "reloaded",
+            )
+            if cache is None or cache.get(reloaded) is None:
+                self.invalidate_servers()
+                if cache is not None:
+                    cache.set(reloaded, True)
+            descriptor = self.get_server_descriptors(**kwargs).get(srvid)
+
+        if descriptor is None:
+            raise HTTPError(404, "Server %s not found." % srvid)
+
+        return descriptor
+
+    def invalidate_servers(self):
+        """
+        Forget the cached servers description for the current repository
+        server.
+        """
+        cache = self.application.settings.get("servers_cache")
+        if cache is not None:
+            repository = self.get_auth("server")
+            cache.invalidate(lambda key: key[0] == repository)
+        self._server_descriptors = {}
+        self.invalidate_session_facts("servers")
 
     def deparse_srvid(self, srvid):
         if srvid == "0":
             return self.current_connection
         else:
-            return self.execute(
-                """
-                                SELECT COALESCE(alias,
-                                                hostname || ':' || port)
-                                       AS server
-                                FROM {powa}.powa_servers
-                                WHERE id = %(srvid)s
-                                """,
-                params={"srvid": int(srvid)},
-            )[0]["server"]
+            descriptor = self.get_server_descriptor(srvid)
+            if descriptor["alias"] is not None:
+                return descriptor["alias"]
+            return "%s:%s" % (descriptor["hostname"], descriptor["port"])
 
     @property
     def servers(self, **kwargs):
@@ -326,43 +679,109 @@ class BaseHandler(RequestHandler, JSONizable):
         Return the list of servers.
         """
         if self.current_user:
-            if self._servers is None:
-                self._servers = [
-                    [s["id"], s["val"], s["alias"]]
-                    for s in self.execute(
-                        """
-                    SELECT s.id, CASE WHEN s.id = 0 THEN
-                        %(default)s
-                    ELSE
-                        s.hostname || ':' || s.port
-                    END AS val,
-                    s.alias
-                    FROM {powa}.powa_servers s
-                    ORDER BY hostname
-                    """,
-                        params={"default": self.current_connection},
-                    )
+
+            def fetch():
+                descriptors = sorted(
+                    self.get_server_descriptors().values(),
+                    key=lambda s: s["hostname"] or "",
+                )
+                return [
+                    [
+                        s["id"],
+                        self.current_connection
+                        if s["id"] == 0
+                        else "%s:%s" % (s["hostname"], s["port"]),
+                        s["alias"],
+                    ]
+                    for s in descriptors
                 ]
-            return self._servers
+
+            return self.get_session_fact("servers", (), fetch)
+
+    def on_connection_close(self):
+        """
+        The client went away, for instance because the user navigated to
+        another page, so cancel the queries still running for this request.
+        The cancelled queries will raise an error and be rolled back as usual,
+        so the connections can still be reused.
+
+        This can only happen if the queries don't block the IOLoop, so if
+        either async_queries or executor_workers is enabled.
+        """
+        super(BaseHandler, self).on_connection_close()
+        self._client_disconnected = True
+
+        nb = 0
+        for conn in list(self._running_conns):
+            try:
+                conn.cancel()
+                nb += 1
+            except Exception as e:
+                self.logger.warning("Could not cancel query: %s", e)
+
+        if nb > 0:
+            total = webstats.incr("cancelled_queries", nb)
+            self.logger.info(
+                "Client disconnected, cancelled %d running queries "
+                "(%d cancelled queries in total)",
+                nb,
+                total,
+            )
+
+    def log_exception(self, typ, value, tb):
+        # Queries cancelled in on_connection_close() are not errors
+        if self._client_disconnected and isinstance(value, QueryCanceledError):
+            return
+        super(BaseHandler, self).log_exception(typ, value, tb)
 
     def on_finish(self):
-        for conn in self._connections.values():
-            conn.close()
+        self.release_connections()
+        self.release_connections(asynchronous=True)
 
-    def connect(
-        self,
-        srvid=None,
-        server=None,
-        user=None,
-        password=None,
-        database=None,
-        remote_access=False,
-        **kwargs,
+    def release_connections(self, urls=None, asynchronous=False):
+        """
+        Give back the connections leased for the given urls, or all of them,
+        to the pool, or close them if there's no pool.
+        """
+        connections = self._connections
+        if asynchronous:
+            connections = self._aconnections
+        if urls is None:
+            urls = list(connections)
+
+        pool = self.application.settings.get("connection_pool")
+        for url in urls:
+            conn = connections.pop(url)
+            if pool is not None:
+                pool.putconn(url, conn)
+            else:
+                conn.close()
+
+    def call_releasing(self, fn, *args):
+        """
+        Call fn(*args), and give back the connections it leased as soon as it
+        returns rather than in on_finish().  This is meant for the functions
+        run on the datasource executor, so that their connections are given
+        back by the executor threads without waiting for the IOLoop.
+        """
+        before = set(self._connections)
+        try:
+            return fn(*args)
+        finally:
+            self.release_connections(
+                [url for url in self._connections if url not in before]
+            )
+
+    def _on_ioloop_thread(self):
+        return threading.get_ident() == self._ioloop_thread
+
+    def __get_connoptions(
+        self, srvid, server, user, password, database, remote_access
     ):
         """
-        Connect to a specific database.
-        Parameters default values are taken from the cookies and the server
-        configuration file.
+        Resolve the connection options for the given target.  Returns a tuple
+        of the connection options, the optional "query" dict and the optional
+        (min, max) pool sizes.
         """
         if srvid is not None and srvid != "0":
             remote_access = True
@@ -372,14 +791,19 @@ class BaseHandler(RequestHandler, JSONizable):
             raise Exception("UI connection globally not allowed.")
 
         conn_allowed = None
-        server = server or self.get_str_cookie("server")
-        user = user or self.get_str_cookie("user")
-        password = password or self.get_str_cookie("password")
+        server = server or self.get_auth("server")
+        user = user or self.get_auth("user")
+        password = password or self.get_auth("password")
         if server not in options.servers:
             raise HTTPError(404, "Server %s not found." % server)
 
         connoptions = options.servers[server].copy()
 
+        # The pool size can be overloaded per configured server, those aren't
+        # connection options.
+        pool_min_size = connoptions.pop("pool_min_size", None)
+        pool_max_size = connoptions.pop("pool_max_size", None)
+
         # Handle "query" parameter.  It should be a dict contain a single
         # client_encoding key.
         encoding_query = connoptions.pop("query", None)
@@ -397,18 +821,7 @@ class BaseHandler(RequestHandler, JSONizable):
                     )
 
         if srvid is not None and srvid != "0":
-            tmp = self.connect()
-            cur = tmp.cursor(cursor_factory=RealDictCursor)
-            cur.execute(
-                """
-            SELECT hostname, port, username, password, dbname,
-                allow_ui_connection
-            FROM {powa}.powa_servers WHERE id = %(srvid)s
-            """,
-                {"srvid": srvid},
-            )
-            row = cur.fetchone()
-            cur.close()
+            row = self.get_server_descriptor(srvid)
 
             connoptions["host"] = row["hostname"]
             connoptions["port"] = row["port"]
@@ -426,20 +839,9 @@ class BaseHandler(RequestHandler, JSONizable):
         if remote_access:
             # authorization check for local connection has not been done yet
             if conn_allowed is None:
-                tmp = self.connect(
-                    remote_access=False,
-                    server=server,
-                    user=user,
-                    password=password,
-                )
-                cur = tmp.cursor()
-                cur.execute("""
-                SELECT allow_ui_connection
-                FROM {powa}.powa_servers WHERE id = 0
-                """)
-                row = cur.fetchone()
-                cur.close()
-                conn_allowed = row[0]
+                conn_allowed = self.get_server_descriptor(
+                    0, server=server, user=user, password=password
+                )["allow_ui_connection"]
 
             if not conn_allowed:
                 raise Exception("UI connection not allowed for this server.")
@@ -447,107 +849,397 @@ class BaseHandler(RequestHandler, JSONizable):
         if database is not None:
             connoptions["database"] = database
 
+        # Don't wait for the default TCP timeout if a remote server is down
+        if (
+            srvid is not None
+            and srvid != "0"
+            and options.remote_connect_timeout > 0
+        ):
+            connoptions.setdefault(
+                "connect_timeout", options.remote_connect_timeout
+            )
+
+        return connoptions, encoding_query, (pool_min_size, pool_max_size)
+
+    def __get_breaker(self, srvid):
+        """
+        Return the circuit breaker to use for connections to the given server,
+        if any.  It's only used for the remote servers.
+        """
+        if srvid is None or str(srvid) == "0":
+            return None
+
+        return self.application.settings.get("circuit_breaker")
+
+    def connect(
+        self,
+        srvid=None,
+        server=None,
+        user=None,
+        password=None,
+        database=None,
+        remote_access=False,
+        bound=None,
+        **kwargs,
+    ):
+        """
+        Connect to a specific database.
+        Parameters default values are taken from the cookies and the server
+        configuration file.
+
+        The connection is leased from the pool until on_finish(), and the
+        lease is bound (see ConnectionPool) if bound is True, or by default
+        if called on the IOLoop thread.  On the IOLoop thread, this never
+        waits for a connection held by another request on the IOLoop, as it
+        couldn't be given back meanwhile, and a PoolTimeout is raised instead.
+        """
+        connoptions, encoding_query, pool_sizes = self.__get_connoptions(
+            srvid, server, user, password, database, remote_access
+        )
+
         url = self.__get_url(**connoptions)
         if url in self._connections:
             return self._connections.get(url)
 
-        conn = psycopg2.connect(
-            connection_factory=CustomConnection, **connoptions
-        )
-        conn.initialize(
-            self.logger,
-            srvid,
-            self.__get_safe_dsn(**connoptions),
-            encoding_query,
-            self.application.settings["debug"],
-        )
+        host = connoptions.get("host")
+        port = connoptions.get("port")
+        breaker = self.__get_breaker(srvid)
+        if breaker is not None:
+            breaker.check(host, port)
 
-        # Get and cache all extensions schemas, in a dict with the extension
-        # name as the key and the *quoted* schema as the value.
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT extname, quote_ident(nspname) AS nsp
-            FROM pg_catalog.pg_extension e
-            JOIN pg_catalog.pg_namespace n ON n.oid = e.extnamespace
-        """)
-        ext_nsps = {row[0]: row[1] for row in cur.fetchall()}
-        cur.close()
-        conn._nsps = ext_nsps
+        def new_connection():
+            try:
+                conn = psycopg2.connect(
+                    connection_factory=CustomConnection, **connoptions
+                )
+            except psycopg2.OperationalError as e:
+                if breaker is None:
+                    # the credentials may not be valid anymore
+                    self.invalidate_auth(server, user, password)
+                elif is_connection_failure(e):
+                    breaker.failure(host, port, e)
+                raise
+
+            if breaker is not None:
+                breaker.success(host, port)
+
+            conn.initialize(
+                self.logger,
+                srvid,
+                self.__get_safe_dsn(**connoptions),
+                encoding_query,
+                self.application.settings["debug"],
+            )
+
+            # Get and cache all extensions schemas, in a dict with the
+            # extension name as the key and the *quoted* schema as the value.
+            # This is done in autocommit mode so that the connection isn't
+            # left in a transaction, and read-only queries can be executed
+            # without a savepoint.
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT extname, quote_ident(nspname) AS nsp
+                FROM pg_catalog.pg_extension e
+                JOIN pg_catalog.pg_namespace n ON n.oid = e.extnamespace
+            """)
+            ext_nsps = {row[0]: row[1] for row in cur.fetchall()}
+            cur.close()
+            conn.autocommit = False
+            conn._nsps = ext_nsps
+
+            return conn
+
+        # Lease a connection from the pool if any, and cache it for the
+        # duration of the request.  It will be given back to the pool in
+        # on_finish(), or earlier if leased by call_releasing().
+        pool = self.application.settings.get("connection_pool")
+        if pool is not None:
+            on_ioloop = self._on_ioloop_thread()
+            conn = pool.getconn(
+                url,
+                new_connection,
+                *pool_sizes,
+                bound=on_ioloop if bound is None else bound,
+                wait_bound=not on_ioloop,
+            )
+        else:
+            conn = new_connection()
 
-        # Cache the connection and return it
         self._connections[url] = conn
         return self._connections[url]
 
-    def __get_extension_version(
-        self, srvid, extname, database=None, remote_access=True
+    async def aconnect(
+        self,
+        srvid=None,
+        server=None,
+        user=None,
+        password=None,
+        database=None,
+        remote_access=False,
     ):
         """
-        Returns a tuple with all digits of the version of the specific
-        extension on the specific server and database, or None if the extension
-        isn't install (or if we fail trying to retrieve the information).
+        Asynchronous version of connect(), returning a connection in
+        asynchronous mode.  Such connections are always in autocommit mode,
+        and can only run a single query at a time.
         """
-        remver = None
+        connoptions, encoding_query, pool_sizes = self.__get_connoptions(
+            srvid, server, user, password, database, remote_access
+        )
 
-        # make sure we have a consistent type for the server id
-        srvid = str(srvid)
+        # set_client_encoding() can't be used in asynchronous mode, so ask
+        # libpq to do it
+        if encoding_query is not None:
+            connoptions["client_encoding"] = encoding_query["client_encoding"]
 
-        # Check for a cached version first.  Note that we do cache the lack of
-        # extension (storing None), so we use an empty string to detect that no
-        # caching happened yet.
-        remver = self._ext_versions[srvid][database].get(extname, "")
+        url = "async " + self.__get_url(**connoptions)
+        if url in self._aconnections:
+            return self._aconnections.get(url)
 
-        if remver != "":
-            return remver
+        host = connoptions.get("host")
+        port = connoptions.get("port")
+        breaker = self.__get_breaker(srvid)
+        if breaker is not None:
+            breaker.check(host, port)
 
-        # For remote server, check first if powa-collector reported a version
-        # for that extension, but only for default database.
-        if srvid != "0" and database is None:
+        async def new_connection():
+            conn = None
             try:
-                remver = self.execute(
-                    """
-                    SELECT version
-                    FROM {powa}.powa_extension_config
-                    WHERE srvid = %(srvid)s
-                    AND extname = %(extname)s
-                    """,
-                    params={"srvid": srvid, "extname": extname},
-                )[0]["version"]
+                conn = psycopg2.connect(
+                    connection_factory=CustomConnection,
+                    async_=True,
+                    **connoptions,
+                )
+                await wait_async(conn)
+            except psycopg2.OperationalError as e:
+                if conn is not None:
+                    conn.close()
+                if breaker is None:
+                    # the credentials may not be valid anymore
+                    self.invalidate_auth(server, user, password)
+                elif is_connection_failure(e):
+                    breaker.failure(host, port, e)
+                raise
+
+            if breaker is not None:
+                breaker.success(host, port)
 
+            try:
+                conn.initialize(
+                    self.logger,
+                    srvid,
+                    self.__get_safe_dsn(**connoptions),
+                    None,
+                    self.application.settings["debug"],
+                )
+
+                cur = _cursor(conn)
+                cur.execute("""
+                    SELECT extname, quote_ident(nspname) AS nsp
+                    FROM pg_catalog.pg_extension e
+                    JOIN pg_catalog.pg_namespace n ON n.oid = e.extnamespace
+                """)
+                await wait_async(conn)
+                conn._nsps = {row[0]: row[1] for row in cur.fetchall()}
+                cur.close()
             except Exception:
-                return None
+                conn.close()
+                raise
+
+            return conn
+
+        pool = self.application.settings.get("connection_pool")
+        if pool is None:
+            conn = await new_connection()
         else:
-            # Otherwise, fall back to querying on the target database.
+            # We can't block the IOLoop while waiting for a connection to be
+            # given back, so poll the pool until its timeout is reached.
+            deadline = time.time() + pool.timeout
+            while True:
+                try:
+                    conn = pool.acquire(
+                        url, *pool_sizes, block=False, bound=True
+                    )
+                    break
+                except PoolTimeout:
+                    if time.time() >= deadline:
+                        raise
+                    await gen.sleep(0.05)
+
+            if conn is None:
+                try:
+                    conn = await new_connection()
+                except Exception:
+                    pool.release(url, bound=True)
+                    raise
+                # asynchronous connections are given back in on_finish()
+                conn._pool_bound = True
+
+        self._aconnections[url] = conn
+        return conn
+
+    def __get_capability(self, key, fetch):
+        """
+        Return the capability identified by the given key, computing it with
+        the given fetch function if it's not cached yet.  The result is cached
+        for the duration of the request, and process-wide for
+        capability_cache_ttl seconds, unless fetch returns None which means
+        that the information couldn't be retrieved.
+        """
+        # The same key can be used on different repository servers
+        key = (key[0], self.get_auth("server")) + key[1:]
+
+        if key in self._capabilities:
+            return self._capabilities[key]
+
+        cache = self.application.settings.get("capabilities_cache")
+        value = None
+        if cache is not None:
+            value = cache.get(key)
+
+        if value is None:
+            value = fetch()
+            if value is None:
+                return None
+
+            if cache is not None:
+                cache.set(key, value)
+
+        self._capabilities[key] = value
+        return value
+
+    def invalidate_capabilities(self, srvid=None):
+        """
+        Forget the cached capabilities of the given server, or of all servers
+        if srvid is None, for the current repository server.
+        """
+        cache = self.application.settings.get("capabilities_cache")
+        if cache is None:
+            return
+
+        repository = self.get_auth("server")
+        if srvid is not None:
+            srvid = str(srvid)
+
+        cache.invalidate(
+            lambda key: key[1] == repository
+            and (srvid is None or key[2] == srvid)
+        )
+        self._capabilities = {}
+
+    def get_capabilities(self, srvid):
+        """
+        Return the ServerCapabilities of the specific server.  Everything is
+        retrieved with a single query on the repository server, except the
+        PostgreSQL version of a remote server if powa-collector didn't report
+        it, and the result is cached like the other capabilities.
+        """
+        # make sure we have a consistent type for the server id
+        srvid = str(srvid or 0)
+
+        def fetch():
             try:
-                remver = self.execute(
+                row = self.execute(
                     """
-                    SELECT extversion
-                    FROM pg_catalog.pg_extension
-                    WHERE extname = %(extname)s
-                    LIMIT 1
-                    """,
-                    srvid=srvid,
-                    database=database,
-                    params={"extname": extname},
-                    remote_access=remote_access,
-                )[0]["extversion"]
+                SELECT s.version, s.allow_ui_connection,
+                    CASE WHEN s.id = 0 THEN
+                        current_setting('server_version_num')::int
+                    END AS pg_version_num,
+                    CASE WHEN s.id = 0 THEN
+                        current_setting('block_size')::int
+                    END AS block_size,
+                    CASE WHEN s.id = 0 THEN (
+                        SELECT json_object_agg(extname, extversion)
+                        FROM pg_catalog.pg_extension
+                    ) ELSE (
+                        SELECT json_object_agg(extname, version)
+                        FROM {powa}.powa_extension_config c
+                        WHERE c.srvid = s.id
+                    ) END AS extensions,
+                    ARRAY(
+                        SELECT DISTINCT name::text
+                        FROM {powa}.powa_functions f
+                        WHERE f.srvid = s.id
+                        AND enabled
+                    ) AS modules
+                FROM {powa}.powa_servers s
+                WHERE s.id = %(srvid)s
+                """,
+                    params={"srvid": srvid},
+                    readonly=True,
+                )[0]
             except Exception:
                 return None
 
-        if remver is None:
-            self._ext_versions[srvid][database][extname] = None
-            return None
+            pg_version_num = row["pg_version_num"]
+            block_size = row["block_size"]
+            if pg_version_num is None:
+                pg_version_num = parse_version_num(row["version"])
 
-        # Clean up any extraneous characters
-        remver = re.search(r"[0-9\.]*[0-9]", remver)
+            # If powa-collector didn't report the version yet, fall back to
+            # asking the remote server
+            if pg_version_num is None:
+                try:
+                    remote = self.execute(
+                        """
+                    SELECT current_setting('server_version_num')::int
+                        AS pg_version_num,
+                        current_setting('block_size')::int AS block_size
+                    """,
+                        srvid=srvid,
+                        readonly=True,
+                    )[0]
+                    pg_version_num = remote["pg_version_num"]
+                    block_size = remote["block_size"]
+                except Exception:
+                    pass
+
+            return ServerCapabilities(
+                srvid,
+                pg_version_num=pg_version_num,
+                block_size=block_size,
+                extensions={
+                    extname: parse_version(version)
+                    for extname, version in (row["extensions"] or {}).items()
+                },
+                modules=frozenset(row["modules"]),
+                allow_ui_connection=row["allow_ui_connection"],
+            )
 
-        if remver is None:
-            self._ext_versions[srvid][database][extname] = None
-            return None
+        caps = self.__get_capability(("capabilities", srvid), fetch)
+        if caps is None:
+            caps = ServerCapabilities(srvid)
+
+        return caps
+
+    def get_last_snapshot(self, srvid):
+        """
+        Return the epoch of the last snapshot of the given server, or None if
+        unknown.  It's cached like the capabilities, so it can be older than
+        the real last snapshot, which is fine for callers that only need to
+        know that the data before it won't change anymore.
+        """
+        srvid = str(srvid or 0)
+
+        def fetch():
+            try:
+                rows = self.execute(
+                    """
+                SELECT extract(epoch FROM snapts) AS snapts
+                FROM {powa}.powa_snapshot_metas
+                WHERE srvid = %(srvid)s
+                """,
+                    params={"srvid": srvid},
+                    readonly=True,
+                )
+            except Exception:
+                return None
 
-        remver = tuple(map(int, remver.group(0).split(".")))
-        self._ext_versions[srvid][database][extname] = remver
+            if not rows or rows[0]["snapts"] is None:
+                return None
+            return float(rows[0]["snapts"])
 
-        return remver
+        return self.__get_capability(("last_snapshot", srvid), fetch)
 
     def has_extension(self, srvid, extname):
         """
@@ -568,22 +1260,10 @@ class BaseHandler(RequestHandler, JSONizable):
                 srvid, extname, "0", remote_access=False
             )
         else:
-            try:
-                # Look for at least an enabled snapshot function.  If a module
-                # provides multiple snapshot functions and only a subset is
-                # activated, let's assume that the extension is available.
-                return self.execute(
-                    """
-                SELECT COUNT(*) != 0 AS res
-                FROM {powa}.powa_functions
-                WHERE srvid = %(srvid)s
-                AND name = %(extname)s
-                AND enabled
-                """,
-                    params={"srvid": srvid, "extname": extname},
-                )[0]["res"]
-            except Exception:
-                return False
+            # Look for at least an enabled snapshot function.  If a module
+            # provides multiple snapshot functions and only a subset is
+            # activated, let's assume that the extension is available.
+            return self.get_capabilities(srvid).has_module(extname)
 
     def has_extension_version(
         self, srvid, extname, version, database=None, remote_access=True
@@ -595,18 +1275,23 @@ class BaseHandler(RequestHandler, JSONizable):
         if version is None:
             raise Exception("No version provided!")
 
-        remver = self.__get_extension_version(
-            srvid, extname, remote_access=remote_access
-        )
+        caps = self.get_capabilities(srvid)
 
-        if remver is None:
-            return False
-
-        wanted = tuple(map(int, version.split(".")))
+        # Checking the local server with remote access requires the UI to be
+        # allowed to connect to it
+        if remote_access and caps.srvid == "0":
+            if not options.allow_ui_connection or not caps.allow_ui_connection:
+                return False
 
-        return remver >= wanted
+        return caps.has_extension_version(extname, version)
 
     def write_error(self, status_code, **kwargs):
+        # Running out of connections or trying to reach a server known to be
+        # down are temporary conditions, not internal errors
+        exc = kwargs.get("exc_info", (None, None, None))[1]
+        if isinstance(exc, (PoolTimeout, ServerUnavailable)):
+            status_code = 503
+            self.set_status(status_code)
         if status_code == 403:
             self._status_code = status_code
             self.clear_all_cookies()
@@ -629,9 +1314,25 @@ class BaseHandler(RequestHandler, JSONizable):
         database=None,
         password=None,
         remote_access=False,
+        readonly=False,
+        timeout=None,
+        tuples=False,
     ):
         """
         Execute a query against a database, with specific bind parameters.
+
+        The query is wrapped in a savepoint, so that an error doesn't abort
+        the current transaction.  If readonly is True and no transaction is
+        in progress, the query is instead executed in autocommit mode, which
+        only needs a single round trip.
+
+        If timeout is provided, the query is executed with that
+        statement_timeout, in seconds, and a QueryCanceledError is raised if
+        it's exceeded.
+
+        The rows are returned as dicts, or if tuples is True as a tuple of the
+        list of column names and the list of rows as tuples, which is cheaper
+        to build for large results.
         """
         if params is None:
             params = {}
@@ -643,10 +1344,149 @@ class BaseHandler(RequestHandler, JSONizable):
             srvid, server, user, password, database, remote_access
         )
 
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        previous_timeout = conn._statement_timeout
+        query = self.__add_timeout_query(conn, query, timeout)
+
+        self._running_conns.add(conn)
+        try:
+            return self.__execute(conn, query, params, readonly, tuples)
+        except Exception:
+            conn._statement_timeout = previous_timeout
+            raise
+        finally:
+            self._running_conns.discard(conn)
+
+    def execute_batches(
+        self,
+        query,
+        srvid=None,
+        params=None,
+        database=None,
+        remote_access=False,
+        timeout=None,
+        itersize=1000,
+    ):
+        """
+        Execute a query using a server-side cursor, and return a generator of
+        the rows, as dicts, by batches of at most itersize rows.  Only one
+        batch is kept in memory at a time, whatever the number of rows.
+
+        Server-side cursors need a transaction, which is committed once all
+        the rows have been fetched if none was in progress, and the query is
+        otherwise wrapped in a savepoint.  The query can't be executed in
+        asynchronous mode.
+        """
+        if params is None:
+            params = {}
+
+        if "samples" not in params:
+            params["samples"] = 100
+
+        # The connection is used until the generator is exhausted, which
+        # depends on the IOLoop if the rows are streamed to the client.
+        conn = self.connect(
+            srvid, database=database, remote_access=remote_access, bound=True
+        )
+        own_transaction = (
+            conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        )
+
+        previous_timeout = conn._statement_timeout
+        self._running_conns.add(conn)
+        try:
+            if not own_transaction:
+                conn.cursor(cursor_factory=CustomTupleCursor).execute(
+                    "SAVEPOINT powa_web_batches"
+                )
+
+            # A server-side cursor can only execute a single statement
+            timeout_query = conn.get_timeout_query(timeout)
+            if timeout_query is not None:
+                cur = conn.cursor(cursor_factory=CustomTupleCursor)
+                cur.execute(timeout_query)
+                cur.close()
+
+            cur = conn.cursor(
+                name="powa_web_batches", cursor_factory=RealDictCursor
+            )
+            cur.itersize = itersize
+            try:
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(itersize)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                if not conn.closed:
+                    cur.close()
+        except BaseException:
+            # also roll back if the generator isn't consumed entirely
+            if not conn.closed:
+                if own_transaction:
+                    conn.rollback()
+                else:
+                    conn.cursor(cursor_factory=CustomTupleCursor).execute(
+                        "ROLLBACK TO SAVEPOINT powa_web_batches"
+                    )
+            conn._statement_timeout = previous_timeout
+            raise
+        else:
+            if own_transaction:
+                conn.commit()
+            else:
+                conn.cursor(cursor_factory=CustomTupleCursor).execute(
+                    "RELEASE SAVEPOINT powa_web_batches"
+                )
+        finally:
+            self._running_conns.discard(conn)
+
+    def __add_timeout_query(self, conn, query, timeout):
+        """
+        Prefix the query with the statement needed to use the given
+        statement_timeout, if any.  It's sent along with the query to avoid an
+        extra round trip, and as both are executed in the same transaction,
+        it's also rolled back if the query fails.
+        """
+        timeout_query = conn.get_timeout_query(timeout)
+        if timeout_query is None:
+            return query
+
+        return "%s; %s" % (timeout_query, query)
+
+    def __execute(self, conn, query, params, readonly, tuples):
+        cur = conn.cursor(
+            cursor_factory=CustomTupleCursor if tuples else RealDictCursor
+        )
+        columns = None
+
+        # A failing query in autocommit mode can't leave the connection in an
+        # aborted transaction, so there's no need for a savepoint.
+        if (
+            readonly
+            and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        ):
+            conn.autocommit = True
+            try:
+                cur.execute(query, params)
+                columns = get_columns(cur)
+
+                if cur.rowcount > 0:
+                    rows = cur.fetchall()
+                else:
+                    rows = []
+            finally:
+                cur.close()
+                if not conn.closed:
+                    conn.autocommit = False
+            if tuples:
+                return columns, rows
+            return rows
+
         cur.execute("SAVEPOINT powa_web")
         try:
             cur.execute(query, params)
+            columns = get_columns(cur)
 
             # Fetch all results if any, and return them.
             if cur.rowcount > 0:
@@ -661,61 +1501,174 @@ class BaseHandler(RequestHandler, JSONizable):
             raise e
         finally:
             cur.close()
+        if tuples:
+            return columns, rows
         return rows
 
-    def notify_collector(self, command, args=[], timeout=3):
+    async def aexecute(
+        self,
+        query,
+        srvid=None,
+        params=None,
+        server=None,
+        user=None,
+        database=None,
+        password=None,
+        remote_access=False,
+        readonly=False,
+        timeout=None,
+        tuples=False,
+    ):
         """
-        Notify powa-collector and get its answer.
+        Coroutine version of execute().  If async_queries is enabled, the query
+        is executed on an asynchronous connection without blocking the IOLoop,
+        so that other requests can be processed meanwhile.  Otherwise, if
+        executor_workers is set, execute() is called on the datasource
+        executor, and if not this simply calls execute().
         """
-        conn = self.connect()
+        if not options.async_queries:
+            args = (
+                query,
+                srvid,
+                params,
+                server,
+                user,
+                database,
+                password,
+                remote_access,
+                readonly,
+                timeout,
+                tuples,
+            )
+            executor = self.application.settings.get("datasource_executor")
+            if executor is not None:
+                return await executor.run(
+                    self.get_executor_srvid(srvid),
+                    self.call_releasing,
+                    self.execute,
+                    *args,
+                )
+            return self.execute(*args)
 
-        cur = conn.cursor()
+        if params is None:
+            params = {}
 
-        # we shouldn't listen on anything else than our own channel, but just
-        # in case discard everything
-        cur.execute("UNLISTEN *")
+        if "samples" not in params:
+            params["samples"] = 100
 
-        random.seed()
-        channel = "r%d" % random.randint(1, 99999)
-        cur.execute("LISTEN %s" % channel)
+        conn = await self.aconnect(
+            srvid, server, user, password, database, remote_access
+        )
 
-        # some commands will contain user-provided strings, so we need to
-        # properly escape the arguments.
-        payload = "%s %s %s" % (command, channel, " ".join(args))
-        cur.execute("NOTIFY powa_collector, %s", (payload,))
+        # Asynchronous connections are in autocommit mode, so there's no need
+        # for a savepoint to recover from errors.
+        cur = _connection.cursor(
+            conn, cursor_factory=_cursor if tuples else RealDictCursor
+        )
+        columns = None
+        previous_timeout = conn._statement_timeout
+        query = self.__add_timeout_query(conn, query, timeout)
+        query = resolve_nsps(query, conn)
+        cur.timestamp = time.time()
+        self._running_conns.add(conn)
+        try:
+            cur.execute(query, params)
+            await wait_async(conn)
+            columns = get_columns(cur)
 
-        cur.close()
-        conn.commit()
+            if cur.rowcount > 0:
+                rows = cur.fetchall()
+            else:
+                rows = []
+        except Exception as e:
+            conn._statement_timeout = previous_timeout
+            log_query(cur, query, params, e)
+            raise e
+        else:
+            log_query(cur, query, params)
+        finally:
+            self._running_conns.discard(conn)
+            cur.close()
+        if tuples:
+            return columns, rows
+        return rows
 
-        # wait for activity on the connection up to given timeout
-        select.select([conn], [], [], timeout)
+    def get_executor_srvid(self, srvid=None):
+        """
+        Return the server to account the work of this request against in the
+        datasource executor, which is the given srvid if any, or else the
+        server the requested page is about.
+        """
+        if srvid is not None:
+            return srvid
 
-        # we shouldn't listen on anything else than our own channel, but just
-        # in case discard everything
-        cur = conn.cursor()
-        cur.execute("UNLISTEN *")
-        conn.commit()
+        params = getattr(self, "params", None) or []
+        return dict(zip(params, self.path_args)).get("server")
 
-        conn.poll()
-        res = []
-        while conn.notifies:
-            notif = conn.notifies.pop(0)
+    async def notify_collector(self, command, args=[], timeout=3):
+        """
+        Notify powa-collector and get its answer.
 
-            payload = notif.payload.split(" ")
+        The command is sent using a connection to the repository server
+        shared by all the requests using the same connection options, and
+        waiting for the answer doesn't block the IOLoop.
+        """
+        _, listener = self.__get_collector_listener()
 
-            received_command = payload.pop(0)
-            # we shouldn't received unexpected messages, but ignore them if any
-            if received_command != command:
-                continue
+        return await listener.notify(command, args, timeout)
 
-            status = payload.pop(0)
-            payload = " ".join(payload)
+    def __get_collector_listener(self):
+        """
+        Return the key and the CollectorListener for the current repository
+        connection options.
+        """
+        connoptions, _, _ = self.__get_connoptions(
+            None, None, None, None, None, False
+        )
+        url = self.__get_url(**connoptions)
 
-            # we should get a single answer, but if multiple are received
-            # append them and let the caller handle it.
-            res.append({status: payload})
+        listeners = self.application.settings.setdefault(
+            "collector_listeners", {}
+        )
+        if url not in listeners:
+            listeners[url] = CollectorListener(
+                lambda: psycopg2.connect(**connoptions), self.logger
+            )
+
+        return url, listeners[url]
+
+    async def get_collector_status(self):
+        """
+        Return the status of the powa-collector workers, as a dict of srvid
+        (as a string) -> status, or None if powa-collector didn't answer.
+
+        If collector_status_interval is set, the status is periodically
+        retrieved in the background and this returns the last known status,
+        which is at most that many seconds old.
+        """
+        if options.collector_status_interval <= 0:
+            raw = await self.notify_collector("WORKERS_STATUS", timeout=1)
+            # get the first correct response only, if multiple answers were
+            # returned
+            for answer in raw:
+                if "OK" in answer:
+                    return json.loads(answer["OK"])
+            return None
+
+        url, listener = self.__get_collector_listener()
+
+        pollers = self.application.settings.setdefault(
+            "collector_status_pollers", {}
+        )
+        if url not in pollers:
+            pollers[url] = CollectorStatusPoller(
+                listener,
+                options.collector_status_interval,
+                logger=self.logger,
+            )
 
-        return res
+        status, _ = await pollers[url].get_status()
+        return status
 
     def get_pickle_cookie(self, name):
         """
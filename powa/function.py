@@ -15,10 +15,10 @@ class FunctionDetail(ContentWidget):
     title = "Function Detail"
     data_url = r"/server/(\d+)/metrics/database/([^\/]+)/function/(\d+)/detail"
 
-    def get(self, server, database, function):
+    async def get(self, server, database, function):
         stmt = powa_getuserfuncdata_detailed_db("%(funcid)s")
 
-        value = self.execute(
+        value = await self.aexecute(
             stmt,
             params={
                 "server": server,
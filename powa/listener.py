@@ -0,0 +1,236 @@
+"""
+Shared infrastructure used to communicate with powa-collector.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+
+class CollectorListener(object):
+    """
+    Send commands to powa-collector and dispatch its answers to the waiting
+    callers, using a single long-lived connection to the repository server.
+
+    Each command is sent with its own channel, on which powa-collector
+    answers.  The connection is registered on the IOLoop, and received
+    notifications are dispatched to the caller waiting on the corresponding
+    channel, so waiting for an answer never blocks the IOLoop.
+
+    The connection is created by the given connect function on first use, and
+    created again if it's broken.  This object must only be used from the
+    IOLoop thread.
+    """
+
+    def __init__(self, connect, logger=None):
+        self._connect = connect
+        self.logger = logger or logging.getLogger("tornado.application")
+        self._conn = None
+        # the file descriptor registered on the IOLoop, kept as the broken
+        # connections can't return it anymore
+        self._fd = None
+        # channel -> (command, future, answers)
+        self._pending = {}
+
+    def _get_connection(self):
+        if self._conn is not None and not self._conn.closed:
+            return self._conn
+
+        # a broken connection is still registered on the IOLoop
+        self._close()
+
+        self._conn = self._connect()
+        self._conn.autocommit = True
+        self._fd = self._conn.fileno()
+        IOLoop.current().add_handler(self._fd, self._on_readable, IOLoop.READ)
+
+        return self._conn
+
+    def _close(self):
+        if self._fd is not None:
+            IOLoop.current().remove_handler(self._fd)
+            self._fd = None
+
+        if self._conn is None:
+            return
+
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+        self._conn = None
+
+    def _on_readable(self, fd, events):
+        try:
+            self._conn.poll()
+        except Exception as e:
+            self.logger.warning("Lost connection to the repository: %s", e)
+            self._close()
+            # Wake up the waiting callers with whatever was received
+            for channel in list(self._pending):
+                self._resolve(channel)
+            return
+
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Dispatch the received notifications to the waiting callers.
+        """
+        while self._conn.notifies:
+            notif = self._conn.notifies.pop(0)
+
+            pending = self._pending.get(notif.channel)
+            # we shouldn't receive unexpected messages, but ignore them if any
+            if pending is None:
+                continue
+
+            command, _, answers = pending
+            payload = notif.payload.split(" ")
+
+            received_command = payload.pop(0)
+            if received_command != command:
+                continue
+
+            status = payload.pop(0)
+            payload = " ".join(payload)
+
+            # we should get a single answer, but if multiple are received
+            # append them and let the caller handle it.
+            answers.append({status: payload})
+
+        # Answers received in the same batch are returned together
+        for channel, (_, _, answers) in list(self._pending.items()):
+            if answers:
+                self._resolve(channel)
+
+    def _resolve(self, channel):
+        pending = self._pending.get(channel)
+        if pending is None:
+            return
+
+        _, future, answers = pending
+        if not future.done():
+            future.set_result(answers)
+
+    async def notify(self, command, args=[], timeout=3):
+        """
+        Send the given command to powa-collector, and return the list of
+        answers received within the timeout.
+        """
+        conn = self._get_connection()
+
+        channel = "r%s" % uuid.uuid4().hex
+        future = Future()
+        self._pending[channel] = (command, future, [])
+
+        io_loop = IOLoop.current()
+        handle = None
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("LISTEN %s" % channel)
+                # some commands will contain user-provided strings, so we
+                # need to properly escape the arguments.
+                payload = "%s %s %s" % (command, channel, " ".join(args))
+                cur.execute("NOTIFY powa_collector, %s", (payload,))
+            finally:
+                cur.close()
+
+            # an answer may already have been received
+            self._dispatch()
+
+            handle = io_loop.call_later(timeout, self._resolve, channel)
+            return await future
+        except Exception:
+            self._close()
+            raise
+        finally:
+            if handle is not None:
+                io_loop.remove_timeout(handle)
+            self._pending.pop(channel, None)
+            self._unlisten(channel)
+
+    def _unlisten(self, channel):
+        if self._conn is None or self._conn.closed:
+            return
+
+        try:
+            cur = self._conn.cursor()
+            cur.execute("UNLISTEN %s" % channel)
+            cur.close()
+        except Exception as e:
+            self.logger.warning("Could not stop listening: %s", e)
+            self._close()
+
+
+class CollectorStatusPoller(object):
+    """
+    Periodically ask powa-collector for the status of its workers, and keep
+    the last answer in memory, so that pages don't have to wait for
+    powa-collector.
+
+    Polling is started on first use, and stopped once the status hasn't been
+    asked for idle_timeout seconds.  This object must only be used from the
+    IOLoop thread.
+    """
+
+    def __init__(self, listener, interval, idle_timeout=300, logger=None):
+        self._listener = listener
+        self.interval = interval
+        self.idle_timeout = max(idle_timeout, interval)
+        self.logger = logger or logging.getLogger("tornado.application")
+        # srvid -> worker status, as of self.timestamp
+        self.status = None
+        self.timestamp = None
+        self._last_used = None
+        self._callback = None
+        self._first_poll = None
+
+    async def get_status(self):
+        """
+        Return the last known status of the workers, as a dict of srvid (as a
+        string) -> status, and its timestamp.  The status is None if
+        powa-collector didn't answer.
+        """
+        self._last_used = time.time()
+
+        if self._callback is None:
+            self._callback = PeriodicCallback(self._poll, self.interval * 1000)
+            self._callback.start()
+            # Don't wait for the next period to get a fresh status
+            self._first_poll = asyncio.ensure_future(self._poll())
+
+        await self._first_poll
+
+        return self.status, self.timestamp
+
+    async def _poll(self):
+        if time.time() - self._last_used > self.idle_timeout:
+            self._callback.stop()
+            self._callback = None
+            return
+
+        try:
+            raw = await self._listener.notify(
+                "WORKERS_STATUS", timeout=min(self.interval, 3)
+            )
+        except Exception as e:
+            self.logger.warning("Could not get the collector status: %s", e)
+            raw = []
+
+        status = None
+        # get the first correct response only, if multiple answers were
+        # returned
+        for answer in raw:
+            if "OK" in answer:
+                status = json.loads(answer["OK"])
+                break
+
+        self.status = status
+        self.timestamp = time.time()
@@ -50,6 +50,208 @@ define(
     help="Allow UI to connect to databases",
     default=True,
 )
+define(
+    "connection_pool",
+    type=bool,
+    help="Reuse the connections across requests",
+    default=True,
+)
+define(
+    "pool_min_size",
+    type=int,
+    help="Number of idle connections kept per target",
+    default=0,
+)
+define(
+    "pool_max_size",
+    type=int,
+    help="Maximum number of connections per target, 0 for unlimited",
+    default=10,
+)
+define(
+    "pool_idle_timeout",
+    type=int,
+    help="Close pooled connections idle for more than this many seconds",
+    default=300,
+)
+define(
+    "pool_check_interval",
+    type=int,
+    help="Check pooled connections idle for more than this many seconds "
+    "before using them",
+    default=30,
+)
+define(
+    "pool_timeout",
+    type=int,
+    help="Maximum number of seconds to wait for a pooled connection",
+    default=5,
+)
+define(
+    "async_queries",
+    type=bool,
+    help="Execute the datasources queries without blocking the server",
+    default=False,
+)
+define(
+    "executor_workers",
+    type=int,
+    help="Number of threads used to execute the datasources, 0 to disable",
+    default=0,
+)
+define(
+    "executor_max_per_server",
+    type=int,
+    help="Maximum number of datasources executed concurrently for a single "
+    "server, 0 for unlimited",
+    default=0,
+)
+define(
+    "batch_max_parallel",
+    type=int,
+    help="Maximum number of datasources of a batch request executed "
+    "concurrently",
+    default=4,
+)
+define(
+    "stream_itersize",
+    type=int,
+    help="Number of rows fetched at once by the metric groups streaming "
+    "their rows, 0 to disable streaming",
+    default=1000,
+)
+define(
+    "result_cache_size",
+    type=int,
+    help="Maximum number of datasources query results kept in cache, 0 to "
+    "disable the cache",
+    default=500,
+)
+define(
+    "result_cache_max_memory",
+    type=int,
+    help="Approximate maximum memory used by the datasources query results "
+    "kept in cache, in megabytes, 0 for unlimited",
+    default=100,
+)
+define(
+    "result_cache_ttl",
+    type=int,
+    help="Number of seconds the datasources query results are cached, for "
+    "ranges including data that can still change",
+    default=10,
+)
+define(
+    "result_cache_immutable_ttl",
+    type=int,
+    help="Number of seconds the datasources query results are cached, for "
+    "ranges ending before the server last snapshot",
+    default=3600,
+)
+define(
+    "snap_ranges",
+    type=bool,
+    help="Snap the datasources time ranges to a grid derived from the "
+    "snapshot frequency, so that close requests share their cached results",
+    default=True,
+)
+define(
+    "tile_points",
+    type=int,
+    default=25,
+    help="Number of points of the time-series tiles, 0 to disable the tiles",
+)
+define(
+    "downsample_factor",
+    type=int,
+    default=10,
+    help="Resolution factor of the rows fetched for the downsampled metric "
+    "groups, 0 to fetch them at full resolution",
+)
+define(
+    "query_timeout",
+    type=float,
+    help="Default maximum duration in seconds of the datasources queries, 0 "
+    "for no limit",
+    default=0,
+)
+define(
+    "remote_connect_timeout",
+    type=int,
+    help="Timeout in seconds when connecting to a remote server, 0 for no "
+    "timeout",
+    default=5,
+)
+define(
+    "remote_retry_min_delay",
+    type=int,
+    help="Number of seconds to wait before trying again to connect to a "
+    "remote server after a failure",
+    default=10,
+)
+define(
+    "remote_retry_max_delay",
+    type=int,
+    help="Maximum number of seconds to wait before trying again to connect to "
+    "a remote server after consecutive failures",
+    default=300,
+)
+define(
+    "collector_status_interval",
+    type=int,
+    help="Interval in seconds between two retrievals of the powa-collector "
+    "status in the background, 0 to retrieve it when needed",
+    default=10,
+)
+define(
+    "capability_cache_ttl",
+    type=int,
+    help="Number of seconds the servers capabilities, such as the installed "
+    "extensions, are cached",
+    default=300,
+)
+define(
+    "servers_cache_ttl",
+    type=int,
+    help="Number of seconds the description of the servers declared on the "
+    "repository server is cached",
+    default=60,
+)
+define(
+    "dashboard_cache_ttl",
+    type=int,
+    help="Number of seconds the description of a dashboard sent to the "
+    "browser is cached, 0 to disable",
+    default=60,
+)
+define(
+    "auth_cache_ttl",
+    type=int,
+    help="Number of seconds a successful authentication is remembered "
+    "before connecting again to check the credentials, 0 to disable",
+    default=60,
+)
+define(
+    "session_cache_ttl",
+    type=int,
+    help="Number of seconds the facts about a user session, like its roles "
+    "or the list of databases, are cached, 0 to disable",
+    default=60,
+)
+define(
+    "server_side_sessions",
+    type=bool,
+    help="Keep the credentials on the server and only send an opaque "
+    "session token to the browser",
+    default=False,
+)
+define(
+    "webstats",
+    type=bool,
+    help="Expose the powa-web internal statistics (caches, executor...) to "
+    "the logged in users on the webstats/ page",
+    default=False,
+)
 define("certfile", type=str, help="Path to certificate file", default=None)
 define("keyfile", type=str, help="Path to key file", default=None)
 
@@ -0,0 +1,290 @@
+"""
+Process-wide pool of PostgreSQL connections.
+
+Connections are shared across requests and indexed by the resolved connection
+options, so that a handler asking for the same target as a previous request
+can reuse an already established and authenticated connection.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from psycopg2.extensions import (
+    TRANSACTION_STATUS_IDLE,
+    TRANSACTION_STATUS_UNKNOWN,
+)
+from psycopg2.extensions import cursor as _cursor
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be leased before the pool timeout.
+    """
+
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of connections, grouped by key.
+
+    Each key represents a single connection target (host, port, user,
+    database...), and has its own min_size and max_size limits.  Idle
+    connections are evicted after idle_timeout seconds, as long as at least
+    min_size connections are kept for that key.  Connections that have been
+    idle for more than check_interval seconds are checked before being handed
+    out, and connections are reset when they are given back to the pool.
+
+    Leases are bound if the connection can only be given back by the IOLoop,
+    for instance in a request on_finish().  A caller running on the IOLoop
+    can't wait for those, as they can't be given back while it blocks, so it
+    asks not to wait for bound leases and gets a PoolTimeout right away
+    rather than freezing the IOLoop if only bound leases could free a slot.
+    """
+
+    def __init__(
+        self,
+        min_size=0,
+        max_size=10,
+        idle_timeout=300,
+        check_interval=30,
+        timeout=5,
+        logger=None,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger("tornado.application")
+
+        self._cond = threading.Condition()
+        # key -> list of (connection, last_used), most recently used last
+        self._idle = defaultdict(list)
+        # key -> number of leased connections
+        self._used = defaultdict(int)
+        # key -> number of bound leased connections
+        self._bound = defaultdict(int)
+        # key -> (min_size, max_size)
+        self._limits = {}
+        self._last_prune = time.time()
+
+    def _get_limits(self, key):
+        return self._limits.get(key, (self.min_size, self.max_size))
+
+    def getconn(
+        self,
+        key,
+        factory,
+        min_size=None,
+        max_size=None,
+        bound=False,
+        wait_bound=True,
+    ):
+        """
+        Lease a connection for the given key.  The factory is called without
+        argument to create a new connection if none is available.
+        """
+        conn = self.acquire(
+            key, min_size, max_size, bound=bound, wait_bound=wait_bound
+        )
+        if conn is None:
+            try:
+                conn = factory()
+            except Exception:
+                self.release(key, bound)
+                raise
+        conn._pool_bound = bound
+        return conn
+
+    def acquire(
+        self,
+        key,
+        min_size=None,
+        max_size=None,
+        block=True,
+        bound=False,
+        wait_bound=True,
+    ):
+        """
+        Reserve a connection slot for the given key.  Returns a usable idle
+        connection if any, or None if the caller has to create a new connection
+        itself, in which case it has to call release() if it fails to do so.
+        If no slot is available, wait up to the pool timeout, or raise
+        PoolTimeout immediately if block is False, or if wait_bound is False
+        and all the slots are held by bound leases.  bound tells whether the
+        lease is bound, see the class description.
+        """
+        if min_size is not None or max_size is not None:
+            self._limits[key] = (
+                self.min_size if min_size is None else min_size,
+                self.max_size if max_size is None else max_size,
+            )
+        _, max_size = self._get_limits(key)
+
+        deadline = time.time() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                self._prune_locked()
+
+                while not self._idle[key] and self._used[key] >= max_size > 0:
+                    remaining = deadline - time.time()
+                    if not wait_bound and self._bound[key] >= self._used[key]:
+                        raise PoolTimeout(
+                            "No connection available, all of them are held "
+                            "by requests still in progress"
+                        )
+                    if not block or remaining <= 0:
+                        raise PoolTimeout(
+                            "No connection available after %s seconds"
+                            % (self.timeout if block else 0)
+                        )
+                    self._cond.wait(remaining)
+
+                if self._idle[key]:
+                    conn, last_used = self._idle[key].pop()
+                self._used[key] += 1
+                if bound:
+                    self._bound[key] += 1
+
+            if conn is None or self._check(conn, last_used):
+                if conn is not None:
+                    conn._pool_bound = bound
+                return conn
+
+            # The connection is broken, discard it and try again
+            self._close(conn)
+            self.release(key, bound)
+
+    def putconn(self, key, conn, close=False):
+        """
+        Give back a connection to the pool.  The connection is reset before
+        being made available to other callers, and closed instead if asked
+        to, if it can't be reset or if the pool is already full for that key.
+        """
+        bound = getattr(conn, "_pool_bound", False)
+        if not getattr(conn, "_reusable", True):
+            close = True
+
+        if not close and not conn.closed:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                self.logger.warning("Could not reset connection: %s", e)
+                close = True
+
+        with self._cond:
+            self._used[key] -= 1
+            if bound:
+                self._bound[key] -= 1
+            _, max_size = self._get_limits(key)
+            nb = self._used[key] + len(self._idle[key])
+            if close or conn.closed or (max_size > 0 and nb >= max_size):
+                close = True
+            else:
+                self._idle[key].append((conn, time.time()))
+            self._cond.notify_all()
+
+        if close:
+            self._close(conn)
+
+    def closeall(self):
+        """
+        Close all the idle connections.
+        """
+        with self._cond:
+            idle = [c for conns in self._idle.values() for c, _ in conns]
+            self._idle.clear()
+
+        for conn in idle:
+            self._close(conn)
+
+    def release(self, key, bound=False):
+        """
+        Release a connection slot reserved by acquire() without giving back a
+        connection.
+        """
+        with self._cond:
+            self._used[key] -= 1
+            if bound:
+                self._bound[key] -= 1
+            self._cond.notify_all()
+
+    def _prune_locked(self):
+        """
+        Evict connections that have been idle for too long, keeping at least
+        min_size connections per key.  Must be called with the lock held.
+        """
+        now = time.time()
+        if now - self._last_prune < min(self.idle_timeout, 10):
+            return
+        self._last_prune = now
+
+        for key in list(self._idle.keys()):
+            min_size, _ = self._get_limits(key)
+            conns = self._idle[key]
+            keep = max(min_size - self._used[key], 0)
+            expired = [
+                c
+                for i, (c, last_used) in enumerate(conns)
+                if now - last_used > self.idle_timeout
+                and i < len(conns) - keep
+            ]
+            if expired:
+                self._idle[key] = [c for c in conns if c[0] not in expired]
+                for conn in expired:
+                    self._close(conn)
+            if not self._idle[key] and self._used[key] == 0:
+                del self._idle[key]
+                self._used.pop(key, None)
+                self._bound.pop(key, None)
+
+    def _check(self, conn, last_used):
+        """
+        Returns whether the given connection is still usable.  Connections
+        that have been idle for less than check_interval are assumed to be
+        working to avoid an extra round trip.
+        """
+        if conn.closed:
+            return False
+
+        # Asynchronous connections can't run synchronous commands
+        if conn.async_:
+            return not conn.isexecuting()
+
+        status = conn.get_transaction_status()
+        if status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+
+        if time.time() - last_used < self.check_interval:
+            return True
+
+        try:
+            cur = _cursor(conn)
+            cur.execute("SELECT 1")
+            cur.close()
+            if not conn.autocommit:
+                conn.rollback()
+        except Exception as e:
+            self.logger.info("Discarding broken pooled connection: %s", e)
+            return False
+
+        return True
+
+    def _reset(self, conn):
+        """
+        Reset the given connection state before putting it back in the pool.
+        """
+        reset = getattr(conn, "reset_session", None)
+        if reset is not None:
+            reset()
+        elif conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
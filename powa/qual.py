@@ -92,7 +92,7 @@ class QualDetail(ContentWidget):
         r"/server/(\d+)/database/([^\/]+)/query/(-?\d+)/qual/(\d+)/detail"
     )
 
-    def get(self, server, database, query, qual):
+    async def get(self, server, database, query, qual):
         try:
             # Check remote access first
             remote_conn = self.connect(
@@ -108,7 +108,7 @@ class QualDetail(ContentWidget):
             extra_groupby=["queryid"],
         )
         quals = list(
-            self.execute(
+            await self.aexecute(
                 stmt,
                 params={
                     "server": server,
@@ -45,6 +45,11 @@ class QueryOverviewMetricGroup(MetricGroupDef):
     name = "query_overview"
     xaxis = "ts"
     data_url = r"/server/(\d+)/metrics/database/([^\/]+)/query/(-?\d+)"
+    # the kcache metrics are joined on ts, see
+    # powa.sql.views_graph.sample_history()
+    sampling = "buckets"
+    # keep the peaks of the dense time-series, see powa.downsample
+    downsample = "lttb"
     rows = MetricDef(
         label="#Rows",
         desc="Sum of the number of rows returned by the query per second",
@@ -339,7 +344,9 @@ class QueryOverviewMetricGroup(MetricGroupDef):
     @property
     def query(self):
         query = powa_getstatdata_sample(
-            "query", ["datname = %(database)s", "queryid = %(query)s"]
+            "query",
+            ["datname = %(database)s", "queryid = %(query)s"],
+            sampling=self.sampling,
         )
 
         total_blocks = "(sum(shared_blks_read) + sum(shared_blks_hit))"
@@ -417,7 +424,9 @@ class QueryOverviewMetricGroup(MetricGroupDef):
             # Add system metrics from pg_stat_kcache,
             # and detailed hit ratio.
             kcache_query = kcache_getstatdata_sample(
-                "query", ["datname = %(database)s", "queryid = %(query)s"]
+                "query",
+                ["datname = %(database)s", "queryid = %(query)s"],
+                sampling=self.sampling,
             )
 
             sys_hits = (
@@ -565,6 +574,9 @@ class QueryIndexes(ContentWidget):
             srvid, "hypopg", "0.0.3", database=database
         )
         if indexes and hypo_version:
+            # hypothetical indexes are kept in the backend memory until
+            # hypopg_reset(), so don't give this connection back to the pool
+            remote_conn._reusable = False
             # identify indexes
             # create them
             allindexes = [
@@ -701,7 +713,9 @@ class WaitsQueryOverviewMetricGroup(MetricGroupDef):
     @property
     def query(self):
         query = powa_getwaitdata_sample(
-            "query", ["datname = %(database)s", "queryid = %(query)s"]
+            "query",
+            ["datname = %(database)s", "queryid = %(query)s"],
+            sampling=self.sampling,
         )
         cols = [to_epoch("ts")]
 
@@ -835,7 +849,7 @@ class QueryDetail(ContentWidget):
     title = "Query Detail"
     data_url = r"/server/(\d+)/metrics/database/([^\/]+)/query/(-?\d+)/detail"
 
-    def get(self, srvid, database, query):
+    async def get(self, srvid, database, query):
         stmt = powa_getstatdata_detailed_db(
             srvid, ["datname = %(database)s", "queryid = %(query)s"]
         )
@@ -865,7 +879,7 @@ class QueryDetail(ContentWidget):
             cols=", ".join(cols), from_clause=from_clause
         )
 
-        value = self.execute(
+        value = await self.aexecute(
             stmt,
             params={
                 "server": srvid,
@@ -246,6 +246,11 @@ class GlobalDatabasesMetricGroup(MetricGroupDef):
     name = "all_databases"
     xaxis = "ts"
     data_url = r"/server/(\d+)/metrics/databases_globals/"
+    # the kcache metrics are joined on ts, see
+    # powa.sql.views_graph.sample_history()
+    sampling = "buckets"
+    # keep the peaks of the dense time-series, see powa.downsample
+    downsample = "lttb"
     avg_runtime = MetricDef(
         label="Avg runtime", type="duration", desc="Average query duration"
     )
@@ -432,7 +437,7 @@ class GlobalDatabasesMetricGroup(MetricGroupDef):
     @property
     def query(self):
         bs = block_size
-        query = powa_getstatdata_sample("db")
+        query = powa_getstatdata_sample("db", sampling=self.sampling)
 
         cols = [
             "sub.srvid",
@@ -492,7 +497,9 @@ class GlobalDatabasesMetricGroup(MetricGroupDef):
             from_clause = "({query}) AS sub2".format(query=query)
 
             # Add system metrics from pg_stat_kcache,
-            kcache_query = kcache_getstatdata_sample("db")
+            kcache_query = kcache_getstatdata_sample(
+                "db", sampling=self.sampling
+            )
 
             total_sys_hit = "greatest({total_read} - sum(sub.reads)/ {ts},0) AS total_sys_hit".format(
                 total_read=total_read("sub", True), ts=get_ts()
@@ -593,7 +600,7 @@ class GlobalWaitsMetricGroup(MetricGroupDef):
 
     @property
     def query(self):
-        query = powa_getwaitdata_sample("db")
+        query = powa_getwaitdata_sample("db", sampling=self.sampling)
 
         cols = [to_epoch("ts", "sub")]
 
@@ -0,0 +1,90 @@
+"""
+Server-side sessions.
+"""
+
+import secrets
+from powa.cache import TTLCache
+
+
+class SessionStore(object):
+    """
+    Process-wide store of the authenticated users sessions.
+
+    When server-side sessions are enabled, the authentication information is
+    kept here rather than in the cookies, and the browser only gets an opaque
+    token.  Sessions are lost when powa-web is restarted, and aren't shared
+    across multiple powa-web processes.  At most max_size sessions are kept,
+    the least recently used ones being dropped first.
+    """
+
+    def __init__(self, ttl, max_size=None):
+        self._sessions = TTLCache(ttl, max_size=max_size)
+
+    def create(self, data, ttl=None):
+        """
+        Create a new session holding the given dict, and return its token.
+        """
+        token = secrets.token_urlsafe(32)
+        self._sessions.set(token, data, ttl)
+        return token
+
+    def get(self, token):
+        """
+        Return the data of the given session, or None if it doesn't exist or
+        expired.
+        """
+        if token is None:
+            return None
+        return self._sessions.get(token)
+
+    def delete(self, token):
+        """
+        Remove the given session.
+        """
+        if token is not None:
+            self._sessions.delete(token)
+
+
+class SessionCache(object):
+    """
+    Process-wide cache of the facts about an authenticated session, like the
+    roles of the user or the databases and servers it can see, which almost
+    never change during a session.
+
+    Entries are identified by the session, a name and optional arguments,
+    and expire after ttl seconds.  At most max_size entries are kept.
+    """
+
+    _missing = object()
+
+    def __init__(self, ttl, max_size=None):
+        self._cache = TTLCache(ttl, max_size=max_size)
+
+    def get(self, session, name, args, fetch):
+        """
+        Return the cached value for the given session, name and arguments,
+        computing it with the given fetch function if needed.
+        """
+        key = (session, name) + tuple(args)
+        value = self._cache.get(key, self._missing)
+        if value is self._missing:
+            value = fetch()
+            self._cache.set(key, value)
+
+        return value
+
+    def invalidate(self, session=None, name=None):
+        """
+        Remove the entries of the given session and/or name, or all the
+        entries if none is given.
+        """
+        self._cache.invalidate(
+            lambda key: (session is None or key[0] == session)
+            and (name is None or key[1] == name)
+        )
+
+    def stats(self):
+        """
+        Return the cache statistics.
+        """
+        return self._cache.stats()
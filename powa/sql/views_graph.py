@@ -73,19 +73,83 @@ class Biggestsum(object):
         return sql
 
 
-BASE_QUERY_SAMPLE_DB = """(
-  SELECT d.srvid, d.datname, base.* FROM {powa}.powa_databases d,
-  LATERAL (
-    SELECT *
+# Expression of the time bucket of the given ts for the "buckets" sampling,
+# see sample_history().  Buckets are aligned on the epoch, like date_bin()
+# does, so that the same snapshots are kept for overlapping ranges.
+SAMPLE_BUCKET = """floor(date_part('epoch', {ts})
+      / greatest(date_part('epoch',
+          %(to)s::timestamptz - %(from)s::timestamptz) / %(samples)s, 1))"""
+
+
+def sample_history(history, alias, partition=None, sampling="rows"):
+    """
+    Return a query keeping about %(samples)s rows, evenly spread over time,
+    of the given history subquery, for each value of the given partition
+    columns.
+
+    The "rows" sampling numbers all the rows to keep one every total /
+    samples of them, which needs two windows over the whole history, one of
+    them counting all the rows before any can be returned.  The "buckets"
+    sampling only keeps the last row of each time bucket: the last ts of
+    each bucket is first aggregated from the history, and only the rows
+    having those ts are kept, so the rates computed between the kept rows
+    are the rates between the bucket boundaries.  As the kept rows only
+    depend on their ts and the range, all the queries using the same range
+    keep the same snapshots, and their results can be joined on ts.  The
+    history is read twice, so it's usually a bit slower than the "rows"
+    sampling, and should only be used for results joined on ts.
+    """
+    over = ""
+    if partition:
+        over = "PARTITION BY %s " % partition
+
+    if sampling == "buckets":
+        columns = "ts"
+        if partition:
+            columns = "%s, ts" % partition
+        return """SELECT *
+    FROM (
+      {history}
+    ) AS {alias}
+    WHERE ({columns}) IN (
+      SELECT {group}max(ts)
+      FROM (
+        {history}
+      ) AS {alias}
+      GROUP BY {group}{bucket}
+    )""".format(
+            history=history,
+            alias=alias,
+            group="%s, " % partition if partition else "",
+            bucket=SAMPLE_BUCKET.format(ts="ts"),
+            columns=columns,
+        )
+
+    if sampling != "rows":
+        raise ValueError("Unknown sampling %s" % sampling)
+
+    return """SELECT *
     FROM (
       SELECT
       row_number() OVER (
-        PARTITION BY dbid ORDER BY statements_history.ts
+        {over}ORDER BY {alias}.ts
       ) AS number,
-      count(*) OVER (PARTITION BY dbid) AS total,
+      count(*) OVER ({partition}) AS total,
       *
       FROM (
-        SELECT dbid, (unnested.records).*
+        {history}
+      ) AS {alias}
+    ) AS sampled
+    WHERE number %% ( int8larger((total)/(%(samples)s+1),1) ) = 0""".format(
+        over=over,
+        partition=over.strip(),
+        history=history,
+        alias=alias,
+    )
+
+
+def base_query_sample_db(sampling="rows"):
+    history = """SELECT dbid, (unnested.records).*
         FROM (
           SELECT psh.dbid, psh.coalesce_range, unnest(records) AS records
           FROM {powa}.powa_statements_history_db psh
@@ -101,30 +165,21 @@ BASE_QUERY_SAMPLE_DB = """(
         WHERE  (record).ts <@ tstzrange(%(from)s, %(to)s, '[]')
         AND dbid = d.oid
         AND srvid = d.srvid
-        AND srvid = %(server)s
-      ) AS statements_history
-    ) AS sh
-    WHERE number %% ( int8larger((total)/(%(samples)s+1),1) ) = 0
+        AND srvid = %(server)s"""
+
+    return """(
+  SELECT d.srvid, d.datname, base.* FROM {{powa}}.powa_databases d,
+  LATERAL (
+    {sample}
   ) AS base
   WHERE srvid = %(server)s
-) AS by_db"""
+) AS by_db""".format(
+        sample=sample_history(history, "statements_history", "dbid", sampling)
+    )
 
 
-BASE_QUERY_SAMPLE = """(
-  SELECT powa_statements.srvid, datname, dbid, queryid, userid, base.*
-  FROM {powa}.powa_statements
-  JOIN {powa}.powa_databases ON powa_databases.oid = powa_statements.dbid
-   AND powa_databases.srvid = powa_statements.srvid,
-  LATERAL (
-      SELECT *
-      FROM (SELECT
-          row_number() OVER (
-            PARTITION BY queryid ORDER BY statements_history.ts
-          ) AS number,
-          count(*) OVER (PARTITION BY queryid) AS total,
-          *
-          FROM (
-              SELECT (unnested.records).*
+def base_query_sample(sampling="rows"):
+    history = """SELECT (unnested.records).*
               FROM (
                   SELECT psh.queryid, psh.coalesce_range,
                     unnest(records) AS records
@@ -141,27 +196,37 @@ BASE_QUERY_SAMPLE = """(
               WHERE (record).ts <@ tstzrange(%(from)s, %(to)s, '[]')
               AND phc.queryid = powa_statements.queryid
               AND phc.userid = powa_statements.userid
-              AND phc.srvid = %(server)s
-          ) AS statements_history
-      ) AS sh
-      WHERE number %% ( int8larger((total)/(%(samples)s+1),1) ) = 0
+              AND phc.srvid = %(server)s"""
+
+    return """(
+  SELECT powa_statements.srvid, datname, dbid, queryid, userid, base.*
+  FROM {{powa}}.powa_statements
+  JOIN {{powa}}.powa_databases ON powa_databases.oid = powa_statements.dbid
+   AND powa_databases.srvid = powa_statements.srvid,
+  LATERAL (
+      {sample}
   ) AS base
   WHERE powa_statements.srvid = %(server)s
 ) AS by_query
 
-"""
+""".format(
+        sample=sample_history(
+            history, "statements_history", "queryid", sampling
+        )
+    )
 
 
-def powa_getstatdata_sample(mode, predicates=[]):
+def powa_getstatdata_sample(mode, predicates=[], sampling="rows"):
     """
-    predicates is an optional array of plain-text predicates.
+    predicates is an optional array of plain-text predicates, and sampling
+    the sampling method, see sample_history().
     """
     if mode == "db":
-        base_query = BASE_QUERY_SAMPLE_DB
+        base_query = base_query_sample_db(sampling)
         base_columns = ["srvid", "dbid"]
 
     elif mode == "query":
-        base_query = BASE_QUERY_SAMPLE
+        base_query = base_query_sample(sampling)
         base_columns = ["srvid", "dbid", "queryid", "userid"]
 
     biggest = Biggest(base_columns, "ts")
@@ -221,116 +286,85 @@ def powa_getstatdata_sample(mode, predicates=[]):
     )
 
 
-BASE_QUERY_KCACHE_SAMPLE_DB = """
-        {powa}.powa_databases d,
+# Sum of the metrics of all the queries, per snapshot, of the given
+# powa_kcache_metrics* tables and predicates
+KCACHE_HISTORY = """SELECT km.ts,
+          sum(km.plan_reads + km.exec_reads) AS reads,
+          sum(km.plan_writes + km.exec_writes) AS writes,
+          sum(km.plan_user_time + km.exec_user_time) AS user_time,
+          sum(km.plan_system_time + km.exec_system_time) AS system_time,
+          sum(km.plan_minflts + km.exec_minflts) AS minflts,
+          sum(km.plan_majflts + km.exec_majflts) AS majflts,
+          -- not maintained on GNU/Linux, and not available on Windows
+          -- sum(km.plan_nswaps + km.exec_nswaps) AS nswaps,
+          -- sum(km.plan_msgsnds + km.exec_msgsnds) AS msgsnds,
+          -- sum(km.plan_msgrcvs + km.exec_msgrcvs) AS msgrcvs,
+          -- sum(km.plan_nsignals + km.exec_nsignals) AS nsignals,
+          sum(km.plan_nvcsws + km.exec_nvcsws) AS nvcsws,
+          sum(km.plan_nivcsws + km.exec_nivcsws) AS nivcsws
+          FROM (
+            SELECT * FROM (
+              SELECT (unnest(metrics)).*
+              FROM {{powa}}.{history} kmh
+              WHERE {predicates}
+              AND kmh.coalesce_range && tstzrange(%(from)s, %(to)s, '[]')
+            ) his
+            WHERE his.ts <@ tstzrange(%(from)s, %(to)s, '[]')
+            UNION ALL
+            SELECT (metrics).*
+            FROM {{powa}}.{current} kmh
+            WHERE {predicates}
+            AND (metrics).ts <@ tstzrange(%(from)s, %(to)s, '[]')
+          ) km
+          GROUP BY km.ts"""
+
+
+def base_query_kcache_sample_db(sampling="rows"):
+    history = KCACHE_HISTORY.format(
+        history="powa_kcache_metrics_db",
+        current="powa_kcache_metrics_current_db",
+        predicates="kmh.srvid = d.srvid AND kmh.dbid = d.oid",
+    )
+
+    return """
+        {{powa}}.powa_databases d,
         LATERAL (
-            SELECT *
-            FROM (
-                SELECT row_number() OVER (ORDER BY kmbq.ts) AS number,
-                    count(*) OVER () as total,
-                        *
-                FROM (
-                    SELECT km.ts,
-                    sum(km.plan_reads + km.exec_reads) AS reads,
-                    sum(km.plan_writes + km.exec_writes) AS writes,
-                    sum(km.plan_user_time + km.exec_user_time) AS user_time,
-                    sum(km.plan_system_time + km.exec_system_time) AS system_time,
-                    sum(km.plan_minflts + km.exec_minflts) AS minflts,
-                    sum(km.plan_majflts + km.exec_majflts) AS majflts,
-                    -- not maintained on GNU/Linux, and not available on Windows
-                    -- sum(km.plan_nswaps + km.exec_nswaps) AS nswaps,
-                    -- sum(km.plan_msgsnds + km.exec_msgsnds) AS msgsnds,
-                    -- sum(km.plan_msgrcvs + km.exec_msgrcvs) AS msgrcvs,
-                    -- sum(km.plan_nsignals + km.exec_nsignals) AS nsignals,
-                    sum(km.plan_nvcsws + km.exec_nvcsws) AS nvcsws,
-                    sum(km.plan_nivcsws + km.exec_nivcsws) AS nivcsws
-                    FROM (
-                        SELECT * FROM (
-                            SELECT (unnest(metrics)).*
-                            FROM {powa}.powa_kcache_metrics_db kmd
-                            WHERE kmd.srvid = d.srvid
-                            AND kmd.dbid = d.oid
-                            AND kmd.coalesce_range &&
-                                tstzrange(%(from)s, %(to)s, '[]')
-                        ) his
-                        WHERE his.ts <@ tstzrange(%(from)s, %(to)s, '[]')
-                        UNION ALL
-                        SELECT (metrics).*
-                        FROM {powa}.powa_kcache_metrics_current_db kmcd
-                        WHERE kmcd.srvid = d.srvid
-                        AND kmcd.dbid = d.oid
-                        AND (metrics).ts <@ tstzrange(%(from)s, %(to)s, '[]')
-                    ) km
-                    GROUP BY km.ts
-                ) kmbq
-            ) kmn
-        WHERE kmn.number %% (int8larger(total/(%(samples)s+1),1) ) = 0
+          {sample}
         ) kcache
-"""
+""".format(sample=sample_history(history, "kmbq", sampling=sampling))
 
 
-BASE_QUERY_KCACHE_SAMPLE = """
-        {powa}.powa_statements s JOIN {powa}.powa_databases d
+def base_query_kcache_sample(sampling="rows"):
+    history = KCACHE_HISTORY.format(
+        history="powa_kcache_metrics",
+        current="powa_kcache_metrics_current",
+        predicates="kmh.srvid = s.srvid AND kmh.queryid = s.queryid "
+        "AND kmh.dbid = s.dbid",
+    )
+
+    return """
+        {{powa}}.powa_statements s JOIN {{powa}}.powa_databases d
             ON d.oid = s.dbid AND d.srvid = s.srvid
             AND s.srvid = %(server)s,
         LATERAL (
-            SELECT *
-            FROM (
-                SELECT row_number() OVER (ORDER BY kmbq.ts) AS number,
-                    count(*) OVER () as total,
-                        *
-                FROM (
-                    SELECT km.ts,
-                    sum(km.plan_reads + km.exec_reads) AS reads,
-                    sum(km.plan_writes + km.exec_writes) AS writes,
-                    sum(km.plan_user_time + km.exec_user_time) AS user_time,
-                    sum(km.plan_system_time + km.exec_system_time) AS system_time,
-                    sum(km.plan_minflts + km.exec_minflts) AS minflts,
-                    sum(km.plan_majflts + km.exec_majflts) AS majflts,
-                    -- not maintained on GNU/Linux, and not available on Windows
-                    -- sum(km.plan_nswaps + km.exec_nswaps) AS nswaps,
-                    -- sum(km.plan_msgsnds + km.exec_msgsnds) AS msgsnds,
-                    -- sum(km.plan_msgrcvs + km.exec_msgrcvs) AS msgrcvs,
-                    -- sum(km.plan_nsignals + km.exec_nsignals) AS nsignals,
-                    sum(km.plan_nvcsws + km.exec_nvcsws) AS nvcsws,
-                    sum(km.plan_nivcsws + km.exec_nivcsws) AS nivcsws
-                    FROM (
-                        SELECT * FROM (
-                            SELECT (unnest(metrics)).*
-                            FROM {powa}.powa_kcache_metrics km
-                            WHERE km.srvid = s.srvid
-                            AND km.queryid = s.queryid
-                            AND km.dbid = s.dbid
-                            AND km.coalesce_range &&
-                                tstzrange(%(from)s, %(to)s, '[]')
-                        ) his
-                        WHERE his.ts <@ tstzrange(%(from)s, %(to)s, '[]')
-                        UNION ALL
-                        SELECT (metrics).*
-                        FROM {powa}.powa_kcache_metrics_current kmc
-                        WHERE kmc.srvid = s.srvid
-                        AND kmc.queryid = s.queryid
-                        AND kmc.dbid = s.dbid
-                        AND (metrics).ts <@ tstzrange(%(from)s, %(to)s, '[]')
-                    ) km
-                    GROUP BY km.ts
-                ) kmbq
-            ) kmn
-        WHERE kmn.number %% (int8larger(total/(%(samples)s+1),1) ) = 0
+          {sample}
         ) kcache
-"""
+""".format(sample=sample_history(history, "kmbq", sampling=sampling))
 
 
-def kcache_getstatdata_sample(mode, predicates=[]):
+def kcache_getstatdata_sample(mode, predicates=[], sampling="rows"):
     """
-    predicates is an optional array of plain-text predicates.
+    predicates is an optional array of plain-text predicates, and sampling
+    the sampling method, see sample_history().  It must be the same as the
+    one of the powa_getstatdata_sample() query it's joined with, so that
+    both keep the same snapshots.
     """
     if mode == "db":
-        base_query = BASE_QUERY_KCACHE_SAMPLE_DB
+        base_query = base_query_kcache_sample_db(sampling)
         base_columns = ["d.oid AS dbid", "srvid, datname"]
         groupby_columns = "d.oid, srvid, datname"
     elif mode == "query":
-        base_query = BASE_QUERY_KCACHE_SAMPLE
+        base_query = base_query_kcache_sample(sampling)
         base_columns = [
             "d.oid AS dbid",
             "d.srvid",
@@ -377,16 +411,8 @@ def kcache_getstatdata_sample(mode, predicates=[]):
     )
 
 
-BASE_QUERY_WAIT_SAMPLE_DB = """(
-  SELECT d.oid AS dbid, datname, base.*
-  FROM {powa}.powa_databases d,
-  LATERAL (
-    SELECT *
-    FROM (SELECT
-      row_number() OVER (
-        PARTITION BY dbid ORDER BY waits_history.ts
-      ) AS number,
-      count(*) OVER (PARTITION BY dbid) AS total,
+def base_query_wait_sample_db(sampling="rows"):
+    history = """SELECT
       srvid,
       ts,
       -- pg 96 columns (bufferpin and lock are included in pg 10+)
@@ -413,6 +439,7 @@ BASE_QUERY_WAIT_SAMPLE_DB = """(
           FROM {powa}.powa_wait_sampling_history_db wsh
           WHERE coalesce_range && tstzrange(%(from)s, %(to)s,'[]')
           AND wsh.dbid = d.oid
+          AND wsh.srvid = d.srvid
           AND wsh.srvid = %(server)s
         ) AS unnested
         WHERE (records).ts <@ tstzrange(%(from)s, %(to)s, '[]')
@@ -424,31 +451,25 @@ BASE_QUERY_WAIT_SAMPLE_DB = """(
         FROM {powa}.powa_wait_sampling_history_current_db wshc
         WHERE (wshc.record).ts <@ tstzrange(%(from)s, %(to)s, '[]')
         AND wshc.dbid = d.oid
+        AND wshc.srvid = d.srvid
         AND wshc.srvid = %(server)s
         GROUP BY wshc.srvid, wshc.dbid, wshc.event_type, (wshc.record).ts
       ) AS waits_history
-      GROUP BY ts, srvid, dbid
-    ) AS wh
-    WHERE number %% ( int8larger((total)/(%(samples)s+1),1) ) = 0
-    AND wh.srvid = d.srvid
+      GROUP BY ts, srvid, dbid"""
+
+    return """(
+  SELECT d.oid AS dbid, datname, base.*
+  FROM {{powa}}.powa_databases d,
+  LATERAL (
+    {sample}
   ) AS base
   WHERE d.srvid = %(server)s
 ) AS by_db
-"""
+""".format(sample=sample_history(history, "wh", sampling=sampling))
 
 
-BASE_QUERY_WAIT_SAMPLE = """(
-  SELECT d.srvid, datname, dbid, queryid, base.*
-  FROM {powa}.powa_statements s
-  JOIN {powa}.powa_databases d ON d.oid = s.dbid
-      AND d.srvid = s.srvid,
-  LATERAL (
-    SELECT *
-    FROM (SELECT
-      row_number() OVER (
-        PARTITION BY queryid ORDER BY waits_history.ts
-      ) AS number,
-      count(*) OVER (PARTITION BY queryid) AS total,
+def base_query_wait_sample(sampling="rows"):
+    history = """SELECT
       ts,
       -- pg 96 columns (bufferpin and lock are included in pg 10+)
       sum(count) FILTER
@@ -487,13 +508,19 @@ BASE_QUERY_WAIT_SAMPLE = """(
         AND wshc.srvid = %(server)s
         GROUP BY wshc.srvid, wshc.event_type, (wshc.record).ts
       ) AS waits_history
-      GROUP BY waits_history.ts
-    ) AS sh
-    WHERE number %% ( int8larger((total)/(%(samples)s+1),1) ) = 0
+      GROUP BY waits_history.ts"""
+
+    return """(
+  SELECT d.srvid, datname, dbid, queryid, base.*
+  FROM {{powa}}.powa_statements s
+  JOIN {{powa}}.powa_databases d ON d.oid = s.dbid
+      AND d.srvid = s.srvid,
+  LATERAL (
+    {sample}
   ) AS base
   WHERE d.srvid = %(server)s
 ) AS by_query
-"""
+""".format(sample=sample_history(history, "wh", sampling=sampling))
 
 
 # Note about xid calculations: we store 32b xids and those wraparounds, so we
@@ -1263,16 +1290,17 @@ BASE_QUERY_USER_FCTS_SAMPLE = """(
     """
 
 
-def powa_getwaitdata_sample(mode, predicates=[]):
+def powa_getwaitdata_sample(mode, predicates=[], sampling="rows"):
     """
-    predicates is an optional array of plain-text predicates.
+    predicates is an optional array of plain-text predicates, and sampling
+    the sampling method, see sample_history().
     """
     if mode == "db":
-        base_query = BASE_QUERY_WAIT_SAMPLE_DB
+        base_query = base_query_wait_sample_db(sampling)
         base_columns = ["srvid", "dbid"]
 
     elif mode == "query":
-        base_query = BASE_QUERY_WAIT_SAMPLE
+        base_query = base_query_wait_sample(sampling)
         base_columns = ["srvid", "dbid", "queryid"]
 
     biggest = Biggest(base_columns, "ts")
@@ -1,15 +1,58 @@
 import * as _ from "lodash";
-import { reactive, ref, watch } from "vue";
+import { computed, reactive, ref, watch } from "vue";
 import { defineStore, storeToRefs } from "pinia";
 import { useRoute } from "vue-router";
 import { useDateRangeStore } from "@/stores/dateRange.js";
 import { useMessageService } from "@/composables/MessageService.js";
 const { addAlertMessages } = useMessageService();
 
+// Call the given function with each line of the response body, as soon as
+// it's received
+async function readLines(response, callback) {
+  if (!response.ok) {
+    throw new Error(response.statusText);
+  }
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    const lines = (buffer + value).split("\n");
+    buffer = lines.pop();
+    lines.forEach((line) => line && callback(line));
+  }
+  buffer && callback(buffer);
+}
+
+// Return the epoch of the last point of the given time series data, which
+// can be asked again with the since parameter to only get the new points
+function getSince(data, from, to) {
+  const rows = data && data.data;
+  const since = !_.isEmpty(rows) && _.last(rows).ts;
+  if (!_.isNumber(since) || since < from || since > to) {
+    return null;
+  }
+  return since;
+}
+
+// Merge the points fetched since the last known one with the previous data
+function mergeData(previous, json, from) {
+  if (_.isNil(json.since) || !previous) {
+    return json;
+  }
+  const kept = _.filter(
+    previous.data,
+    (row) => row.ts >= from && row.ts < json.since
+  );
+  return { ...json, data: kept.concat(json.data) };
+}
+
 export const useDashboardStore = defineStore("dashboard", () => {
   const route = useRoute();
   const dateRangeStore = useDateRangeStore();
-  const { urlSearchParams } = storeToRefs(dateRangeStore);
+  const { searchParams, urlSearchParams } = storeToRefs(dateRangeStore);
   const isFetching = ref(false);
   const dashboardConfig = ref(null);
   const handlerConfig = ref({ homeUrl: "" });
@@ -19,8 +62,12 @@ export const useDashboardStore = defineStore("dashboard", () => {
   const changes = ref(null);
   const changesFetching = ref(false);
   const cursorPosition = ref(null);
+  const batchUrl = ref(null);
+  const dashboardParams = ref({});
   let dashboardController;
   let changesController;
+  // The metric groups to fetch with the next batch request
+  let pendingSources = [];
 
   function cleanUpDashboard() {
     // Force a clean up of all components for the page
@@ -29,6 +76,7 @@ export const useDashboardStore = defineStore("dashboard", () => {
   }
 
   function cleanUpDataSources() {
+    pendingSources = [];
     _.each(dataSources.value, (source) => {
       source.controller && source.controller.abort();
     });
@@ -62,6 +110,8 @@ export const useDashboardStore = defineStore("dashboard", () => {
     handlerConfig.value = config.handler;
     breadcrumbs.value = config.breadcrumbs;
     changesUrl.value = config.timeline;
+    batchUrl.value = config.batch_url;
+    dashboardParams.value = config.params;
 
     config.datasources.forEach((config) => {
       try {
@@ -76,20 +126,37 @@ export const useDashboardStore = defineStore("dashboard", () => {
 
       function executeFn() {
         source.isFetching = true;
+        source.executed = true;
+        // Only the new points are needed when refreshing the same range
+        const rawRange = [dateRangeStore.rawFrom, dateRangeStore.rawTo];
+        source.since = _.isEqual(source.rawRange, rawRange)
+          ? getSince(
+              source.data,
+              dateRangeStore.from.unix(),
+              dateRangeStore.to.unix()
+            )
+          : null;
+        source.rawRange = rawRange;
+        if (batchUrl.value && source.config.type == "metric_group") {
+          queueSource(source);
+          return;
+        }
+        const params = new URLSearchParams(searchParams.value);
+        _.isNil(source.since) || params.set("since", source.since);
+        const from = dateRangeStore.from.unix();
         source.controller = new AbortController();
-        fetch(`${source.config.data_url}?${urlSearchParams.value}`, {
+        fetch(`${source.config.data_url}?${params}`, {
           signal: source.controller.signal,
         })
           .then((res) => res.json())
           .then((json) => {
-            source.data = json;
+            source.data = mergeData(source.data, json, from);
             addAlertMessages(json.messages);
           })
           .catch((err) => (source.error = err))
           .finally(() => {
             source.isFetching = false;
           });
-        source.executed = true;
       }
 
       const source = reactive({
@@ -99,6 +166,8 @@ export const useDashboardStore = defineStore("dashboard", () => {
         error: null,
         controller: null,
         executed: false,
+        since: null,
+        rawRange: null,
         execute: executeFn,
       });
       dataSources.value[config.name] = source;
@@ -109,6 +178,72 @@ export const useDashboardStore = defineStore("dashboard", () => {
     dashboardConfig.value = config.dashboard;
   }
 
+  function queueSource(source) {
+    if (pendingSources.length == 0) {
+      // Fetch all the metric groups executed by the widgets being rendered
+      // at once
+      setTimeout(fetchBatch);
+    }
+    pendingSources.push(source);
+  }
+
+  function fetchBatch() {
+    const sources = _.keyBy(pendingSources, "config.url_name");
+    pendingSources = [];
+    const controller = new AbortController();
+    _.each(sources, (source) => {
+      source.controller = controller;
+    });
+    // Ignore the sources executed again since this batch was sent
+    const current = (source) => source && source.controller === controller;
+    const from = dateRangeStore.from.unix();
+    const datasourceParams = {};
+    _.each(sources, (source, name) => {
+      if (!_.isNil(source.since)) {
+        datasourceParams[name] = { since: source.since };
+      }
+    });
+
+    fetch(batchUrl.value, {
+      method: "POST",
+      signal: controller.signal,
+      body: JSON.stringify({
+        datasources: _.keys(sources),
+        params: { ...dashboardParams.value, ...searchParams.value },
+        datasource_params: datasourceParams,
+      }),
+      headers: {
+        "Content-type": "application/json; charset=UTF-8",
+      },
+    })
+      .then((res) =>
+        readLines(res, (line) => {
+          const result = JSON.parse(line);
+          const source = sources[result.datasource];
+          if (!current(source)) {
+            return;
+          }
+          if (result.error) {
+            source.error = result.error;
+          } else {
+            source.data = mergeData(source.data, result.data, from);
+            addAlertMessages(result.data.messages);
+          }
+          source.isFetching = false;
+        })
+      )
+      .catch((err) => {
+        _.each(_.filter(sources, current), (source) => {
+          source.error = err;
+        });
+      })
+      .finally(() => {
+        _.each(_.filter(sources, current), (source) => {
+          source.isFetching = false;
+        });
+      });
+  }
+
   function fetchDataSources() {
     cleanUpDataSources();
     _.each(dataSources.value, (source) => {
@@ -137,6 +272,12 @@ export const useDashboardStore = defineStore("dashboard", () => {
       });
   }
 
+  // The range the data was fetched for, as snapped by the server, which is
+  // the same for all the metric groups of the dashboard
+  const dataRange = computed(() =>
+    _.find(_.map(_.values(dataSources.value), "data.range"))
+  );
+
   watch(() => route.path, fetchDashboardConfig);
   watch(() => [dataSources.value, urlSearchParams.value], fetchDataSources);
   watch(() => [changesUrl.value, urlSearchParams.value], fetchChanges);
@@ -146,6 +287,7 @@ export const useDashboardStore = defineStore("dashboard", () => {
     changes,
     changesFetching,
     dashboardConfig,
+    dataRange,
     dataSources,
     handlerConfig,
     isFetching,
@@ -20,11 +20,13 @@ export const useDateRangeStore = defineStore("daterange", () => {
     return dateMath.parse(rawTo.value);
   });
 
+  const searchParams = computed(() => ({
+    from: from.value.format("YYYY-MM-DD HH:mm:ssZZ"),
+    to: to.value.format("YYYY-MM-DD HH:mm:ssZZ"),
+  }));
+
   const urlSearchParams = computed(() =>
-    new URLSearchParams({
-      from: from.value.format("YYYY-MM-DD HH:mm:ssZZ"),
-      to: to.value.format("YYYY-MM-DD HH:mm:ssZZ"),
-    }).toString()
+    new URLSearchParams(searchParams.value).toString()
   );
 
   function refresh() {
@@ -42,5 +44,14 @@ export const useDateRangeStore = defineStore("daterange", () => {
     return { path: url, query };
   }
 
-  return { rawFrom, rawTo, from, to, refresh, getUrl, urlSearchParams };
+  return {
+    rawFrom,
+    rawTo,
+    from,
+    to,
+    refresh,
+    getUrl,
+    searchParams,
+    urlSearchParams,
+  };
 });
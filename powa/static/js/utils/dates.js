@@ -7,4 +7,19 @@ function toISO(date) {
   return date.startOf("minute").toISO({ suppressSeconds: true });
 }
 
-export { toISO };
+// Parse the range a metric group was fetched for, as snapped by the server,
+// and return its bounds as JS dates, or null if there's none
+function parseRange(range) {
+  if (!range) {
+    return null;
+  }
+  const bounds = [range.from, range.to].map((value) =>
+    DateTime.fromFormat(value, "yyyy-MM-dd HH:mm:ssZZZ")
+  );
+  if (!bounds.every((bound) => bound.isValid)) {
+    return null;
+  }
+  return bounds.map((bound) => bound.toJSDate());
+}
+
+export { parseRange, toISO };
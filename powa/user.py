@@ -18,9 +18,12 @@ class LoginHandler(BaseHandler):
         if expires_days == 0:
             expires_days = None
 
+        # Check the credentials on a new connection, a pooled one could have
+        # been authenticated before they changed
         try:
-            self.connect(user=user, password=password, server=server)
+            self.check_credentials(user=user, password=password, server=server)
         except Exception as e:
+            self.invalidate_auth(user=user, password=password, server=server)
             self.flash("Auth failed", "alert")
             self.logger.error("Error: %r", e)
             self.get()
@@ -47,13 +50,29 @@ class LoginHandler(BaseHandler):
                 "alert",
             )
             self.redirect(self.url_prefix)
-        self.set_secure_cookie("user", user, expires_days=expires_days)
-        self.set_secure_cookie("password", password, expires_days=expires_days)
-        self.set_secure_cookie("server", server, expires_days=expires_days)
+        if options.server_side_sessions:
+            # Only give an opaque token to the browser
+            store = self.application.settings["session_store"]
+            store.delete(self.get_str_cookie("session"))
+            token = store.create(
+                {"user": user, "password": password, "server": server},
+                ttl=(expires_days or 1) * 86400,
+            )
+            self.set_secure_cookie("session", token, expires_days=expires_days)
+        else:
+            self.set_secure_cookie("user", user, expires_days=expires_days)
+            self.set_secure_cookie(
+                "password", password, expires_days=expires_days
+            )
+            self.set_secure_cookie("server", server, expires_days=expires_days)
         self.redirect(self.get_argument("next", self.url_prefix))
 
 
 class LogoutHandler(BaseHandler):
     def get(self):
+        self.invalidate_auth()
+        if options.server_side_sessions:
+            store = self.application.settings["session_store"]
+            store.delete(self.get_str_cookie("session"))
         self.clear_all_cookies()
         return self.redirect(self.url_prefix)
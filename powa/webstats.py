@@ -0,0 +1,62 @@
+"""
+Process-wide statistics about powa-web itself.
+
+Counters can be incremented from any thread, either global ones or keyed
+ones, counting occurrences per key (for instance per datasource).  Other
+components can also register a provider returning their own statistics.
+Everything is exposed as JSON by the WebStatsHandler.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_keyed_counters = {}
+_providers = {}
+
+
+def incr(name, value=1):
+    """
+    Increment the given counter, and return its new value.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        return _counters[name]
+
+
+def observe(name, key, value=1):
+    """
+    Increment the given key of the given keyed counter.
+    """
+    with _lock:
+        counter = _keyed_counters.setdefault(name, {})
+        counter[key] = counter.get(key, 0) + value
+
+
+def register(name, provider):
+    """
+    Register a callable returning a JSON-serializable object, which will be
+    added to the statistics with the given name.
+    """
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot():
+    """
+    Return all the current statistics.
+    """
+    with _lock:
+        res = {
+            "counters": dict(_counters),
+            "keyed_counters": {
+                name: dict(counter)
+                for name, counter in _keyed_counters.items()
+            },
+        }
+        providers = list(_providers.items())
+
+    for name, provider in providers:
+        res[name] = provider()
+
+    return res
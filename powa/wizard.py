@@ -62,6 +62,9 @@ class IndexSuggestionHandler(AuthHandler):
         indbyname = {}
         inderrors = {}
         if hypo_version:
+            # hypothetical indexes are kept in the backend memory until
+            # hypopg_reset(), so don't give this connection back to the pool
+            remote_conn._reusable = False
             # identify indexes
             # create them
             for ind in indexes:
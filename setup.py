@@ -9,7 +9,7 @@ with open("powa/__init__.py") as f:
             __VERSION__ = line.split("=")[1].replace('"', "").strip()
 
 
-requires = ["tornado>=2.0", "psycopg2"]
+requires = ["tornado>=6.0", "psycopg2"]
 
 # include ordereddict for python2.6
 if sys.version_info < (2, 7, 0):
@@ -23,6 +23,7 @@ setup(
     license="Postgresql",
     packages=find_packages(),
     install_requires=requires,
+    extras_require={"numpy": ["numpy"]},
     include_package_data=True,
     url="https://powa.readthedocs.io/",
     description="A User Interface for the PoWA project",
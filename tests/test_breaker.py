@@ -0,0 +1,87 @@
+"""
+Tests for the circuit breaker of the remote servers.
+"""
+
+import unittest
+from powa.breaker import (
+    CircuitBreaker,
+    ServerUnavailable,
+    is_connection_failure,
+)
+
+
+class FakeError(Exception):
+    def __init__(self, message, pgcode=None):
+        super(FakeError, self).__init__(message)
+        self.pgcode = pgcode
+
+
+class TestIsConnectionFailure(unittest.TestCase):
+    # messages of psycopg2.OperationalError as raised by libpq 16, none of
+    # them having an SQLSTATE
+    def test_unreachable(self):
+        for message in (
+            'connection to server at "127.0.0.1", port 54330 failed: '
+            "Connection refused\n\tIs the server running on that host and "
+            "accepting TCP/IP connections?\n",
+            'connection to server at "10.255.255.1", port 5432 failed: '
+            "timeout expired\n",
+            'connection to server at "10.255.255.1", port 5432 failed: '
+            "server closed the connection unexpectedly\n\tThis probably "
+            "means the server terminated abnormally\n\tbefore or while "
+            "processing the request.\n",
+            'could not translate host name "nope.invalid" to address: '
+            "Name or service not known\n",
+            'connection to server at "127.0.0.1", port 54597 failed: '
+            "SSL SYSCALL error: EOF detected\n",
+        ):
+            self.assertTrue(is_connection_failure(FakeError(message)), message)
+
+    def test_server_errors(self):
+        for message in (
+            'connection to server at "127.0.0.1", port 54329 failed: '
+            "fe_sendauth: no password supplied\n",
+            'connection to server at "127.0.0.1", port 54329 failed: '
+            'FATAL:  password authentication failed for user "powa"\n',
+            'connection to server at "127.0.0.1", port 54329 failed: '
+            'FATAL:  role "nologin" is not permitted to log in\n',
+            'connection to server at "127.0.0.1", port 54329 failed: '
+            'FATAL:  no pg_hba.conf entry for host "127.0.0.1", user '
+            '"postgres", database "postgres", no encryption\n',
+            'connection to server on socket "/tmp/.s.PGSQL.54329" failed: '
+            'FATAL:  role "nobody" does not exist\n',
+            'connection to server on socket "/tmp/.s.PGSQL.54329" failed: '
+            'FATAL:  database "nope" does not exist\n',
+            'connection to server at "127.0.0.1", port 54329 failed: '
+            "server does not support SSL, but SSL was required\n",
+            'connection to server at "127.0.0.1", port 35349 failed: '
+            "SSL error: wrong version number\nThis may indicate that the "
+            "server does not support any SSL protocol version between "
+            "TLSv1.2 and TLSv1.3.\n",
+        ):
+            self.assertFalse(
+                is_connection_failure(FakeError(message)), message
+            )
+
+    def test_sqlstate(self):
+        self.assertTrue(is_connection_failure(FakeError("", "08006")))
+        self.assertFalse(is_connection_failure(FakeError("", "28P01")))
+        self.assertFalse(is_connection_failure(FakeError("", "3D000")))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_failure_and_success(self):
+        breaker = CircuitBreaker(min_delay=60)
+        breaker.check("db", 5432)
+
+        breaker.failure("db", 5432, "Connection refused")
+        with self.assertRaises(ServerUnavailable):
+            breaker.check("db", 5432)
+        breaker.check("db", 5433)
+
+        breaker.success("db", 5432)
+        breaker.check("db", 5432)
+
+
+if __name__ == "__main__":
+    unittest.main()
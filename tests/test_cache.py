@@ -0,0 +1,55 @@
+"""
+Tests for the process-wide caches.
+"""
+
+import unittest
+from powa.cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiration(self):
+        cache = TTLCache(60)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=-1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_max_size(self):
+        cache = TTLCache(60, max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_max_bytes(self):
+        cache = TTLCache(60, max_bytes=500)
+        for key in "abcde":
+            self.assertTrue(cache.set(key, key, size=50))
+        cache.get("a")
+        for key in "fghijk":
+            cache.set(key, key, size=50)
+
+        # the least recently used entries are evicted first
+        self.assertEqual(cache.stats()["bytes"], 500)
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("k"), "k")
+
+        cache.delete("k")
+        cache.invalidate(lambda key: key == "j")
+        self.assertEqual(cache.stats()["bytes"], 400)
+
+    def test_max_bytes_too_big(self):
+        cache = TTLCache(60, max_bytes=1000)
+        cache.set("a", 1, size=50)
+        self.assertFalse(cache.set("b", 2, size=101))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
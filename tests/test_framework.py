@@ -0,0 +1,63 @@
+"""
+Tests for the base request handler.
+"""
+
+import unittest
+from powa import options as _options  # noqa: F401 (defines the options)
+from powa.cache import TTLCache
+from powa.framework import BaseHandler
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.options import options
+from tornado.web import Application, HTTPError
+from unittest import mock
+
+
+class FakeHandler(BaseHandler):
+    # number of times the servers were loaded from the repository server
+    loaded = 0
+
+    def execute(self, query, *args, **kwargs):
+        FakeHandler.loaded += 1
+        return [{"id": 1}]
+
+    def get_auth(self, name):
+        return {"server": "main", "user": "powa"}.get(name)
+
+
+class TestServerDescriptor(unittest.TestCase):
+    def setUp(self):
+        options.url_prefix = "/"
+        FakeHandler.loaded = 0
+        self.application = Application(debug=False, servers_cache=TTLCache(60))
+
+    def get_handler(self):
+        request = HTTPServerRequest(
+            "GET", "/", headers=HTTPHeaders(), connection=mock.Mock()
+        )
+        return FakeHandler(self.application, request)
+
+    def test_unknown_server_reloads_once(self):
+        self.assertEqual(self.get_handler().get_server_descriptor(1)["id"], 1)
+        self.assertEqual(FakeHandler.loaded, 1)
+
+        # the first unknown server reloads the servers, in case it was just
+        # added
+        with self.assertRaises(HTTPError):
+            self.get_handler().get_server_descriptor(2)
+        self.assertEqual(FakeHandler.loaded, 2)
+
+        # but not the next ones, until the cache expires
+        for _ in range(3):
+            with self.assertRaises(HTTPError):
+                self.get_handler().get_server_descriptor(2)
+        self.assertEqual(FakeHandler.loaded, 2)
+
+        # or the collector configuration is reloaded
+        self.get_handler().invalidate_servers()
+        with self.assertRaises(HTTPError):
+            self.get_handler().get_server_descriptor(2)
+        self.assertEqual(FakeHandler.loaded, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests for the listener of the powa-collector answers.
+"""
+
+import socket
+import unittest
+from powa.listener import CollectorListener
+from tornado.testing import AsyncTestCase
+
+
+class FakeConnection(object):
+    """
+    The subset of a psycopg2 connection used by the listener, using the given
+    socket as its file descriptor.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.closed = 0
+        self.autocommit = False
+        self.notifies = []
+
+    def fileno(self):
+        # like psycopg2, a broken connection doesn't return its descriptor
+        if self.closed:
+            raise Exception("connection already closed")
+        return self.sock.fileno()
+
+    def poll(self):
+        if self.closed:
+            raise Exception("server closed the connection unexpectedly")
+
+    def close(self):
+        self.closed = 1
+
+
+class TestCollectorListener(AsyncTestCase):
+    def setUp(self):
+        super(TestCollectorListener, self).setUp()
+        self.sock, self.other = socket.socketpair()
+        self.conns = []
+
+    def tearDown(self):
+        self.sock.close()
+        self.other.close()
+        super(TestCollectorListener, self).tearDown()
+
+    def connect(self):
+        # the new connections reuse the descriptor of the broken ones, as
+        # the kernel would
+        self.conns.append(FakeConnection(self.sock))
+        return self.conns[-1]
+
+    def test_reconnect_after_broken_connection(self):
+        listener = CollectorListener(self.connect)
+        first = listener._get_connection()
+
+        # the connection breaks while registered on the IOLoop
+        first.closed = 2
+        listener._on_readable(self.sock.fileno(), None)
+        second = listener._get_connection()
+        self.assertIsNot(second, first)
+
+        # and also when noticed on next use only
+        second.closed = 2
+        third = listener._get_connection()
+        self.assertIsNot(third, second)
+        self.assertEqual(listener._fd, self.sock.fileno())
+
+        listener._close()
+        self.assertIsNone(listener._fd)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,267 @@
+"""
+Tests for the metric groups HTTP handler, using a metric group whose query
+execution is replaced by rows generated for the requested range.
+"""
+
+import json
+import math
+import unittest
+from datetime import datetime
+from powa import options as _options  # noqa: F401 (defines the options)
+from powa.cache import TTLCache
+from powa.dashboards import DatasourceBatchHandler, MetricDef, MetricGroupDef
+from tornado.options import options
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application, URLSpec
+
+FROM = "2024-01-01 10:00:00+0000"
+TO = "2024-01-01 12:00:00+0000"
+
+
+class FakeMetricGroup(MetricGroupDef):
+    name = "fake"
+    data_url = r"/server/(\d+)/metrics/fake/"
+    metric = MetricDef(label="Metric")
+    query = "SELECT 1"
+
+    # the parameters of the executed queries
+    executed = []
+
+    def execute(
+        self,
+        query,
+        srvid=None,
+        params=None,
+        server=None,
+        user=None,
+        database=None,
+        password=None,
+        remote_access=False,
+        readonly=False,
+        timeout=None,
+        tuples=False,
+    ):
+        FakeMetricGroup.executed.append(dict(params))
+        # a point per snapshot of the range
+        start = datetime.fromisoformat(params["from"]).timestamp()
+        end = datetime.fromisoformat(params["to"]).timestamp()
+        start, end = math.ceil(start / 300), math.floor(end / 300)
+        rows = [(ts * 300.0, ts % 7) for ts in range(start, end + 1)]
+        if tuples:
+            return ["ts", "metric"], rows
+        return [{"ts": ts, "metric": metric} for ts, metric in rows]
+
+    def get_last_snapshot(self, srvid):
+        return None
+
+    def get_server_descriptor(self, srvid, *args, **kwargs):
+        return {"frequency": 300}
+
+    @property
+    def current_user(self):
+        return "powa"
+
+    def get_auth(self, name):
+        if name == "user":
+            return self.request.headers.get("X-Test-User", "powa")
+        return {"server": "main"}.get(name)
+
+
+class FakeBatchHandler(DatasourceBatchHandler):
+    @property
+    def current_user(self):
+        return "powa"
+
+
+class MetricGroupTestCase(AsyncHTTPTestCase):
+    # attributes overriding the ones of FakeMetricGroup
+    attributes = {}
+
+    def get_settings(self):
+        return {}
+
+    def setUp(self):
+        options.url_prefix = "/"
+        FakeMetricGroup.executed = []
+        super(MetricGroupTestCase, self).setUp()
+
+    def get_app(self):
+        self.handler = type(
+            "FakeMetricGroup",
+            (FakeMetricGroup, FakeMetricGroup.datasource_handler_cls),
+            dict(FakeMetricGroup.__dict__, **self.attributes),
+        )
+        spec = URLSpec(
+            FakeMetricGroup.data_url,
+            self.handler,
+            {"datasource": FakeMetricGroup, "params": ["server"]},
+            name="datasource_FakeMetricGroup",
+        )
+        batch = URLSpec(r"/datasource/batch/", FakeBatchHandler)
+        return Application(
+            [spec, batch],
+            cookie_secret="secret",
+            debug=False,
+            **self.get_settings(),
+        )
+
+    def fetch_metrics(self, headers=None, **params):
+        query = "&".join(
+            "%s=%s" % (k, v.replace(" ", "%20").replace("+", "%2B"))
+            for k, v in params.items()
+        )
+        return self.fetch("/server/1/metrics/fake/?" + query, headers=headers)
+
+
+class TestSince(MetricGroupTestCase):
+    def test_since_in_range(self):
+        response = self.fetch_metrics(
+            **{"from": FROM, "to": TO, "since": "1704103200"}
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)["since"], 1704103200)
+        self.assertEqual(
+            FakeMetricGroup.executed[0]["from"],
+            "2024-01-01 09:59:59.999000+0000",
+        )
+
+    def test_since_out_of_range(self):
+        for since in ("1704103199", "1704110401", "2024-01-02 10:00:00+0000"):
+            response = self.fetch_metrics(
+                **{"from": FROM, "to": TO, "since": since}
+            )
+            self.assertEqual(response.code, 400, since)
+
+    def test_since_invalid(self):
+        for since in ("yesterday", "nan"):
+            response = self.fetch_metrics(
+                **{"from": FROM, "to": TO, "since": since}
+            )
+            self.assertEqual(response.code, 400, since)
+        self.assertEqual(FakeMetricGroup.executed, [])
+
+    def test_since_in_batch(self):
+        body = {
+            "datasources": ["datasource_FakeMetricGroup"],
+            "params": {"server": "1", "from": FROM, "to": TO},
+            "datasource_params": {
+                "datasource_FakeMetricGroup": {"since": 1704103200}
+            },
+        }
+        response = self.fetch(
+            "/datasource/batch/", method="POST", body=json.dumps(body)
+        )
+        self.assertEqual(response.code, 200)
+        result = json.loads(response.body)
+        self.assertEqual(result["datasource"], "datasource_FakeMetricGroup")
+        self.assertEqual(result["data"]["since"], 1704103200)
+
+
+class TestResultCache(MetricGroupTestCase):
+    def get_settings(self):
+        self.cache = TTLCache(60, max_size=100)
+        return {"result_cache": self.cache}
+
+    def test_nearby_ranges_share_results(self):
+        """
+        Requests a few seconds apart are snapped to the same range, and are
+        served from the same cached result.
+        """
+        first = self.fetch_metrics(
+            **{
+                "from": "2024-01-01 10:00:10+0000",
+                "to": "2024-01-01 12:00:05+0000",
+            }
+        )
+        self.assertEqual(first.code, 200)
+        executed = len(FakeMetricGroup.executed)
+        self.assertGreater(executed, 0)
+        stats = self.cache.stats()
+
+        second = self.fetch_metrics(
+            **{
+                "from": "2024-01-01 10:00:40+0000",
+                "to": "2024-01-01 12:00:50+0000",
+            }
+        )
+        self.assertEqual(second.code, 200)
+        self.assertEqual(len(FakeMetricGroup.executed), executed)
+        self.assertEqual(self.cache.stats()["size"], stats["size"])
+        self.assertEqual(
+            self.cache.stats()["hits"], stats["hits"] + stats["size"]
+        )
+        self.assertEqual(
+            json.loads(second.body)["range"], json.loads(first.body)["range"]
+        )
+
+    def test_roles_dont_share_results(self):
+        params = {"from": FROM, "to": TO}
+        self.fetch_metrics(**params)
+        executed = len(FakeMetricGroup.executed)
+
+        self.fetch_metrics(headers={"X-Test-User": "other"}, **params)
+        self.assertEqual(len(FakeMetricGroup.executed), 2 * executed)
+
+
+class TestTiles(MetricGroupTestCase):
+    attributes = {"tiled": True}
+
+    def get_settings(self):
+        return {"result_cache": TTLCache(60, max_size=100)}
+
+    def fetch_data(self, **params):
+        response = self.fetch_metrics(**params)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)["data"]
+
+    def test_tiles_match_whole_range(self):
+        """
+        The rows assembled from the tiles are the ones the query returns for
+        the whole range.
+        """
+        # tiles of 25 points of 600s cover 4h10, so this range spans 2 tiles
+        params = {
+            "from": "2024-01-01 02:00:00+0000",
+            "to": "2024-01-01 06:00:00+0000",
+            "samples": "24",
+        }
+        tiled = self.fetch_data(**params)
+        self.assertEqual(len(FakeMetricGroup.executed), 2)
+        self.assertEqual(len(tiled), 49)
+
+        self.handler.tiled = False
+        self.assertEqual(self.fetch_data(**params), tiled)
+        self.assertEqual(len(FakeMetricGroup.executed), 3)
+
+    def test_not_tiled_by_default(self):
+        del self.handler.tiled
+        self.fetch_data(**{"from": FROM, "to": TO})
+        self.assertEqual(len(FakeMetricGroup.executed), 1)
+
+
+class TestDownsample(MetricGroupTestCase):
+    attributes = {"downsample": "lttb"}
+
+    def test_downsampled(self):
+        response = self.fetch_metrics(
+            **{"from": FROM, "to": TO, "samples": "10"}
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body)["data"]), 10)
+        # the rows are fetched at a higher resolution
+        self.assertEqual(
+            FakeMetricGroup.executed[0]["samples"],
+            10 * options.downsample_factor,
+        )
+
+    def test_downsample_disabled(self):
+        response = self.fetch_metrics(
+            **{"from": FROM, "to": TO, "samples": "10", "downsample": "none"}
+        )
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body)["data"]), 25)
+        self.assertEqual(FakeMetricGroup.executed[0]["samples"], "10")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tests for the process-wide connection pool.
+"""
+
+import threading
+import time
+import unittest
+from powa.pool import ConnectionPool, PoolTimeout
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection(object):
+    """
+    The subset of a psycopg2 connection used by the pool.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.async_ = False
+        self.autocommit = False
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def reset_session(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    key = "postgresql://powa@localhost:5432/powa"
+
+    def setUp(self):
+        self.pool = ConnectionPool(max_size=2, timeout=5)
+
+    def test_reuse(self):
+        conn = self.pool.getconn(self.key, FakeConnection)
+        self.pool.putconn(self.key, conn)
+        self.assertIs(self.pool.getconn(self.key, FakeConnection), conn)
+
+    def test_ioloop_not_starved_by_workers(self):
+        """
+        Executor workers filling the pool give back their leases by
+        themselves, so a request on the IOLoop waits for them and is served.
+        """
+        leased = threading.Barrier(3)
+
+        def worker():
+            conn = self.pool.getconn(self.key, FakeConnection)
+            leased.wait()
+            time.sleep(0.2)
+            self.pool.putconn(self.key, conn)
+
+        workers = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in workers:
+            thread.start()
+        leased.wait()
+
+        start = time.time()
+        conn = self.pool.getconn(
+            self.key, FakeConnection, bound=True, wait_bound=False
+        )
+        self.assertIsNotNone(conn)
+        self.assertLess(time.time() - start, self.pool.timeout)
+        self.pool.putconn(self.key, conn)
+
+        for thread in workers:
+            thread.join()
+
+    def test_ioloop_doesnt_wait_for_bound_leases(self):
+        """
+        Leases only given back by the IOLoop can't be waited for on the
+        IOLoop, which would freeze it until the pool timeout.
+        """
+        conns = [
+            self.pool.getconn(self.key, FakeConnection, bound=True)
+            for _ in range(2)
+        ]
+
+        start = time.time()
+        with self.assertRaises(PoolTimeout):
+            self.pool.getconn(
+                self.key, FakeConnection, bound=True, wait_bound=False
+            )
+        self.assertLess(time.time() - start, 1)
+
+        for conn in conns:
+            self.pool.putconn(self.key, conn)
+        conn = self.pool.getconn(
+            self.key, FakeConnection, bound=True, wait_bound=False
+        )
+        self.assertIn(conn, conns)
+
+    def test_factory_failure_releases_slot(self):
+        def factory():
+            raise RuntimeError("connection refused")
+
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                self.pool.getconn(self.key, factory, bound=True)
+        self.assertEqual(self.pool._used[self.key], 0)
+        self.assertEqual(self.pool._bound[self.key], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()